@@ -7,8 +7,8 @@ from tkinter import filedialog, ttk
 import ttkthemes
 
 import detector_proc
-from behavior_senpai import vcap, windows_and_mac
-from gui_parts import Checkbutton, Combobox
+from behavior_senpai import vcap, video_proxy, windows_and_mac
+from gui_parts import Checkbutton, Combobox, IntEntry
 
 
 class App(ttk.Frame):
@@ -40,6 +40,20 @@ class App(ttk.Frame):
         self.roi_chk = Checkbutton(bat_mode_frame, "ROI", description=roi_desc)
         self.roi_chk.pack_horizontal(padx=(0, 10))
 
+        auto_roi_desc = (
+            "If checked, sets the ROI automatically around the people found in about 30 frames sampled from the video.\n"
+            "Available in batch mode as well. If ROI is also checked, the ROI you draw is used instead."
+        )
+        self.auto_roi_chk = Checkbutton(bat_mode_frame, "Auto ROI", description=auto_roi_desc)
+        self.auto_roi_chk.pack_horizontal(padx=(0, 10))
+
+        proxy_desc = (
+            'If checked, also writes a small proxy video to the "proxy" folder next to each video after detection.\n'
+            "The viewers read frames from the proxy, which makes browsing long or 4K videos faster."
+        )
+        self.proxy_chk = Checkbutton(bat_mode_frame, "Make proxy", description=proxy_desc)
+        self.proxy_chk.pack_horizontal(padx=(0, 10))
+
         suffix_desc = "If checked, adds a suffix to the output video file indicating the engine used."
         self.add_suffix_chk = Checkbutton(bat_mode_frame, "Add suffix", description=suffix_desc)
         self.add_suffix_chk.pack_horizontal(padx=(0, 15))
@@ -58,6 +72,14 @@ class App(ttk.Frame):
         self.engine_combo = Combobox(bat_mode_frame, "Engine:", values=combo_list, width=24)
         self.engine_combo.pack_horizontal(padx=(10, 0))
 
+        workers_desc = (
+            'Number of videos processed in parallel in batch mode ("Apply all").\n'
+            "Each video runs in its own process. If 1, videos are processed one by one."
+        )
+        self.workers_entry = IntEntry(bat_mode_frame, "Workers:", default="1", width=3, description=workers_desc)
+        self.workers_entry.pack_horizontal(padx=(10, 0))
+        self.workers_entry.set_state(tk.DISABLED)
+
         top_btn_frame = ttk.Frame(self)
         top_btn_frame.pack(pady=14)
         self.select_video_btn = ttk.Button(top_btn_frame, text="Select video file", command=self.select_video, width=20)
@@ -84,6 +106,8 @@ class App(ttk.Frame):
         self.exec_detector_btn = ttk.Button(bottom_frame, text="Start", command=self.exec_detector)
         self.exec_detector_btn.pack(side=tk.LEFT)
         self.exec_detector_btn["state"] = tk.DISABLED
+        self.status_label = ttk.Label(bottom_frame, text="")
+        self.status_label.pack(side=tk.LEFT, padx=(10, 0))
 
         self.rcap = vcap.RoiCap()
 
@@ -119,15 +143,61 @@ class App(ttk.Frame):
             self.exec_video(self.tar_path)
 
     def exec_folder(self):
-        """Execute the detector for all video files in the selected folder."""
+        """Execute the detector for all video files in the selected folder.
+        If "Workers" is 2 or more, the videos are processed in parallel worker processes.
+        """
         video_paths = glob.glob(os.path.join(self.tar_path, "*.mp4"))
         video_paths += glob.glob(os.path.join(self.tar_path, "*.mov"))
-        for video_path in video_paths:
-            self.exec_video(video_path)
+        workers = self.workers_entry.get()
+        if workers <= 1:
+            # 同じモデルを全ての動画で使い回し、途中で失敗しても最後に解放する(MediaPipeは使い回さずに動画ごとに作る)
+            try:
+                for i, video_path in enumerate(video_paths):
+                    self._set_status(f"[{i + 1}/{len(video_paths)}] {os.path.basename(video_path)}")
+                    self.exec_video(video_path, use_cache=True)
+            finally:
+                detector_proc.clear_model_cache()
+        else:
+            if self.move_chk.get() is True:
+                datetime_str = self.start_datetime.strftime("%Y_%m_%d")
+                video_paths = [windows_and_mac.move_to_videos(video_path, f"BehaviorSenpai_{datetime_str}") for video_path in video_paths]
+            model_name = self.engine_combo.get()
+            add_suffix = self.add_suffix_chk.get()
+            auto_roi = self.auto_roi_chk.get()
+            self._set_status(f"[0/{len(video_paths)}] Running with {workers} workers")
+            results = detector_proc.exec_batch(
+                model_name,
+                video_paths,
+                workers=workers,
+                add_suffix=add_suffix,
+                auto_roi=auto_roi,
+                progress=self._on_batch_progress,
+            )
+            trk_paths = [trk_path for trk_path in results.values() if trk_path is not None]
+            if len(trk_paths) > 0:
+                self.trk_path = trk_paths[-1]
+            failed_paths = [video_path for video_path, trk_path in results.items() if trk_path is None]
+            if len(failed_paths) > 0:
+                print(f"Failed: {len(failed_paths)}/{len(video_paths)} videos")
+            if self.proxy_chk.get() is True:
+                for video_path in video_paths:
+                    video_proxy.make_proxy(video_path)
         print(f"{datetime.datetime.now()} Done")
+        self._set_status(f"Done: {len(video_paths)} videos")
+
+    def _on_batch_progress(self, done_num, total_num, video_path, trk_path):
+        """Show which video has just finished or failed while the worker processes run."""
+        result = "Done" if trk_path is not None else "Failed"
+        self._set_status(f"[{done_num}/{total_num}] {result}: {os.path.basename(video_path)}")
+
+    def _set_status(self, text):
+        """Show text next to the Start button and redraw it, since the detection blocks the event loop."""
+        self.status_label["text"] = text
+        self.update_idletasks()
 
-    def exec_video(self, video_path):
+    def exec_video(self, video_path, use_cache=False):
         """Execute the detector for the selected video file.
+        If use_cache is True, the initialized model is kept and reused for the next video (except MediaPipe).
         連続実行するとmediapipeがNULLポインタ参照で落ちるので回避策としてsubprocessを使用.
         """
         print(f"{datetime.datetime.now()} {video_path}")
@@ -139,7 +209,10 @@ class App(ttk.Frame):
         model_name = self.engine_combo.get()
         use_roi = self.roi_chk.get()
         add_suffix = self.add_suffix_chk.get()
-        self.trk_path = detector_proc.exec(self.rcap, model_name, video_path, use_roi, add_suffix)
+        auto_roi = self.auto_roi_chk.get()
+        self.trk_path = detector_proc.exec(self.rcap, model_name, video_path, use_roi, add_suffix, use_cache=use_cache, auto_roi=auto_roi)
+        if self.proxy_chk.get() is True:
+            video_proxy.make_proxy(video_path)
 
     def _on_bat_mode_changed(self, *args):
         if self.bat_chk.get() is True:
@@ -147,10 +220,12 @@ class App(ttk.Frame):
             self.video_path_label["text"] = "No folder selected"
             self.roi_chk.set(False)
             self.roi_chk.set_state(tk.DISABLED)
+            self.workers_entry.set_state(tk.NORMAL)
         else:
             self.select_video_btn["text"] = "Select video file"
             self.video_path_label["text"] = "No video selected"
             self.roi_chk.set_state(tk.NORMAL)
+            self.workers_entry.set_state(tk.DISABLED)
         self.tar_path = ""
         self.open_btn["state"] = tk.DISABLED
         self.go_to_folder_btn["state"] = tk.DISABLED
@@ -0,0 +1,87 @@
+import os
+import pickle
+
+import pandas as pd
+
+
+class DetectCheckpoint:
+    """
+    検出途中の結果をtrack fileの隣(trk/xxx.ckpt)に定期的に書き出し、中断したところから再開できるようにする
+    ファイルの先頭にmeta(dict)、その後ろにinterval_framesごとの差分({"last_frame": int, "rows": DataFrame})を追記していく
+    追記の途中で落ちて最後のレコードが壊れていても、それより前のレコードは読める
+    """
+
+    def __init__(self, pkl_path, meta: dict, interval_frames=3000):
+        self.path = f"{os.path.splitext(pkl_path)[0]}.ckpt"
+        self.meta = meta
+        self.interval_frames = interval_frames
+        self.saved_rows = 0
+        self.saved_frame = -1
+
+    def load(self):
+        """
+        metaが一致するcheckpointがあれば(last_frame, track DataFrame)を返す、なければNone
+        """
+        if os.path.exists(self.path) is False:
+            return None
+        chunks = []
+        last_frame = -1
+        with open(self.path, "rb") as f:
+            try:
+                meta = pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                print(f"Broken checkpoint: {self.path}")
+                return None
+            if meta != self.meta:
+                print(f"Checkpoint does not match the current settings: {self.path}")
+                return None
+            # 最後に読めたレコードの終わりの位置
+            good_end = f.tell()
+            while True:
+                try:
+                    record = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    break
+                chunks.append(record["rows"])
+                last_frame = record["last_frame"]
+                good_end = f.tell()
+            file_size = f.seek(0, os.SEEK_END)
+        if file_size > good_end:
+            # 書き込み途中で落ちたレコードを切り捨てる、残したままupdate()で追記すると再開後のレコードが読めなくなる
+            print(f"Truncated a broken record at the end of the checkpoint: {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+        if last_frame < 0:
+            return None
+        return last_frame, pd.concat(chunks, axis=0)
+
+    def start(self, start_frame=0, resumed=False):
+        """
+        resumed=Falseなら新しいcheckpointを作る、Trueなら既存のcheckpointに追記していく
+        """
+        self.saved_rows = 0
+        self.saved_frame = start_frame - 1
+        if resumed is True:
+            return
+        with open(self.path, "wb") as f:
+            pickle.dump(self.meta, f)
+
+    def update(self, frame_num, buffer):
+        """
+        前回の保存からinterval_frames以上進んでいたら、増えた分の行を追記する
+        """
+        if self.interval_frames <= 0:
+            return
+        if frame_num - self.saved_frame < self.interval_frames:
+            return
+        rows = buffer.to_dataframe(start=self.saved_rows)
+        with open(self.path, "ab") as f:
+            pickle.dump({"last_frame": frame_num, "rows": rows}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        self.saved_rows = len(buffer)
+        self.saved_frame = frame_num
+
+    def remove(self):
+        if os.path.exists(self.path) is True:
+            os.remove(self.path)
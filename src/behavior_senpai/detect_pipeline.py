@@ -0,0 +1,263 @@
+import queue
+import threading
+
+import cv2
+
+from behavior_senpai import img_draw, vcap
+
+
+class DetectPipeline:
+    """
+    フレームの読み込み、推論、結果の取り出し/描画をそれぞれ別のスレッドで並行に実行する
+    読み込みスレッド -> (queue) -> 推論(呼び出し元のスレッド) -> (queue) -> 後処理スレッド
+    queueのサイズを制限しているので、速いステージが先走ってもメモリは増え続けない
+    HighGUIはスレッドセーフではなく、macOSではメインスレッドでしか動かないので、
+    後処理スレッドは表示する画像を作るだけで、imshow()とwaitKey()は呼び出し元のスレッドで行う
+    """
+
+    def __init__(
+        self,
+        cap,
+        total_frame_num,
+        roi=False,
+        show=True,
+        batch_size=1,
+        queue_size=8,
+        progress=None,
+        start_frame=0,
+        end_frame=None,
+        buffer=None,
+        checkpoint=None,
+        stride=1,
+        motion_threshold=0,
+        infer_size=None,
+        store=None,
+    ):
+        """
+        progress(frame_num, total_frame_num): 1フレーム分の後処理が終わるたびに呼ばれる
+        start_frame: このフレームから読み込みを始める(checkpointからの再開用)
+        end_frame: このフレームの手前で読み込みをやめる、Noneなら最後まで(時間で分割して並列に検出するとき用)
+        checkpoint: DetectCheckpoint、後処理のたびにbufferを渡して定期的に書き出させる
+        stride: strideの倍数のframeだけ推論し、それ以外はgrab()で読み飛ばす
+        motion_threshold: 縮小したグレースケール画像で、最後に推論したframeとの差の平均がこれ以下なら推論せずに
+            直前のframeの結果をbufferに繰り返し詰める、0なら常に推論する
+        infer_size: 長辺がこれより大きいframeは、色変換や推論の前に長辺がinfer_sizeになるように縮小する
+            推論結果の座標はinfer_scaleで割って元のframeの座標に戻す
+        store: TrackStore、bufferを定期的にファイルへ追記させ、追記した行はbufferから捨てる
+        """
+        self.cap = cap
+        self.total_frame_num = total_frame_num
+        self.roi = roi
+        self.show = show
+        self.batch_size = max(1, int(batch_size))
+        self.queue_size = queue_size
+        self.progress = progress
+        self.start_frame = start_frame
+        self.end_frame = total_frame_num if end_frame is None else min(end_frame, total_frame_num)
+        self.buffer = buffer
+        self.checkpoint = checkpoint
+        self.store = store
+        self.stride = max(1, int(stride))
+        # 読み飛ばしたframeも含めた{frame: timestamp}
+        self.frame_timestamps = {}
+        self.motion_threshold = motion_threshold
+        self.motion_skipped_num = 0
+        self.inferred_num = 0
+
+        # 縮小後のframeの大きさと、元の大きさに対する(x, y)の倍率
+        if roi is True:
+            width, height = cap.roi_width, cap.roi_height
+        else:
+            width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.infer_frame_size = None
+        self.infer_scale = (1.0, 1.0)
+        if infer_size is not None and infer_size > 0 and max(width, height) > infer_size:
+            ratio = infer_size / max(width, height)
+            self.infer_frame_size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+            self.infer_scale = (self.infer_frame_size[0] / width, self.infer_frame_size[1] / height)
+
+    def run(self, infer, extract, draw=None):
+        """
+        infer(frames) -> results: フレームのリストを受け取り、同じ長さの推論結果のリストを返す
+        extract(i, result, timestamp): 推論結果を取り出して保持する
+        draw(frame, result) -> frame: show=Trueのときに表示する画像を返す
+        """
+        self.stop_event = threading.Event()
+        self.errors = []
+        # 後処理スレッドが作った最新の表示用画像、表示が追いつかなければ古い画像は捨てる
+        self.show_lock = threading.Lock()
+        self.show_frame = None
+        read_queue = queue.Queue(maxsize=self.queue_size)
+        post_queue = queue.Queue(maxsize=self.queue_size)
+        reader = threading.Thread(target=self._read_loop, args=(read_queue,), daemon=True)
+        poster = threading.Thread(target=self._post_loop, args=(post_queue, extract, draw), daemon=True)
+        reader.start()
+        poster.start()
+
+        try:
+            batch = []
+            while self.stop_event.is_set() is False:
+                self._show()
+                try:
+                    item = read_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is not None:
+                    batch.append(item)
+                # batch_size分たまるか最終フレームまで来たらまとめて推論
+                # 動きがなかったframe(is_static)は推論しないが、順番を保つためにbatchに入れておく
+                infer_num = len([is_static for *_, is_static in batch if is_static is False])
+                is_full = infer_num >= self.batch_size or infer_num == 0 or len(batch) >= self.batch_size + self.queue_size
+                if len(batch) > 0 and (item is None or is_full):
+                    frames = [frame for _, frame, _, is_static in batch if is_static is False]
+                    results = iter(infer(frames) if len(frames) > 0 else [])
+                    for i, frame, timestamp, is_static in batch:
+                        result = None if is_static is True else next(results)
+                        self._put(post_queue, (i, frame, result, timestamp, is_static), on_wait=self._show)
+                    batch = []
+                if item is None:
+                    break
+            self._put(post_queue, None, on_wait=self._show)
+            # 後処理が終わるまで残りのフレームを表示する
+            while poster.is_alive() is True:
+                self._show()
+                poster.join(timeout=0.01)
+            self._show()
+        except BaseException:
+            self.stop_event.set()
+            raise
+        finally:
+            reader.join()
+            poster.join()
+            if self.show is True:
+                cv2.destroyAllWindows()
+        if len(self.errors) > 0:
+            raise self.errors[0]
+        if self.motion_threshold > 0:
+            total_num = self.inferred_num + self.motion_skipped_num
+            print(f"Motion gate: skipped {self.motion_skipped_num}/{total_num} frames (threshold={self.motion_threshold})")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _put(self, tar_queue, item, on_wait=None):
+        """
+        途中終了したときにput()で固まらないようにtimeout付きで繰り返す
+        on_wait: queueが空くのを待っている間に呼ぶ(呼び出し元のスレッドで表示を続けるため)
+        """
+        while self.stop_event.is_set() is False:
+            try:
+                tar_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if on_wait is not None:
+                    on_wait()
+                continue
+        return False
+
+    def _show(self):
+        """
+        呼び出し元のスレッドで、後処理スレッドが作った最新の画像を表示する、xキーで途中終了
+        """
+        if self.show is False:
+            return
+        with self.show_lock:
+            frame = self.show_frame
+            self.show_frame = None
+        if frame is None:
+            return
+        cv2.imshow("dst", frame)
+        key = cv2.waitKey(1) & 0xFF
+        if key == ord("x"):
+            self.stop_event.set()
+
+    def _is_static(self, frame):
+        """
+        縮小したグレースケール画像で、最後に推論したframeとの差を見る
+        """
+        if self.motion_threshold <= 0:
+            return False
+        width = 160
+        height = max(1, int(frame.shape[0] * width / frame.shape[1]))
+        small_img = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        gray_img = cv2.cvtColor(small_img, cv2.COLOR_BGR2GRAY)
+        if self.motion_ref_img is not None and cv2.absdiff(gray_img, self.motion_ref_img).mean() <= self.motion_threshold:
+            return True
+        self.motion_ref_img = gray_img
+        return False
+
+    def _read_loop(self, read_queue):
+        self.motion_ref_img = None
+        try:
+            if self.start_frame > 0:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            for i in range(self.start_frame, self.end_frame):
+                if self.stop_event.is_set() is True:
+                    return
+                # 推論しないframeはデコード後の変換を省くためにgrab()だけする
+                if i % self.stride != 0:
+                    if self.cap.grab() is True:
+                        self.frame_timestamps[i] = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+                    continue
+                if self.roi is True:
+                    ret, frame = self.cap.get_roi_frame()
+                else:
+                    ret, frame = self.cap.read()
+                if ret is False:
+                    print("Failed to read frame.")
+                    continue
+                if self.infer_frame_size is not None:
+                    frame = cv2.resize(frame, self.infer_frame_size, interpolation=cv2.INTER_AREA)
+                # timestampはread()の直後に取得する
+                timestamp = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+                self.frame_timestamps[i] = timestamp
+                is_static = self._is_static(frame)
+                self._put(read_queue, (i, frame, timestamp, is_static))
+            self._put(read_queue, None)
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
+
+    def _post_loop(self, post_queue, extract, draw):
+        try:
+            while self.stop_event.is_set() is False:
+                try:
+                    item = post_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    break
+                i, frame, result, timestamp, is_static = item
+
+                # 検出結果を描画して、表示は呼び出し元のスレッドに任せる
+                if self.show is True:
+                    if draw is not None and is_static is False:
+                        frame = draw(frame, result)
+                    _, frame = vcap.resize_frame(frame)
+                    img_draw.put_frame_pos(frame, i, self.total_frame_num)
+                    img_draw.put_message(frame, "'x' key to exit.", font_size=1.5, y=55)
+                    with self.show_lock:
+                        self.show_frame = frame
+
+                if self.buffer is not None:
+                    self.buffer.begin_frame()
+                if is_static is True:
+                    self.buffer.repeat_last_frame(i, timestamp)
+                    self.motion_skipped_num += 1
+                else:
+                    extract(i, result, timestamp)
+                    self.inferred_num += 1
+                if self.checkpoint is not None:
+                    self.checkpoint.update(i, self.buffer)
+                if self.store is not None:
+                    self.store.update(i, self.buffer)
+                    # checkpointがまだ書き出していない行は残す
+                    release_row = self.store.saved_rows
+                    if self.checkpoint is not None:
+                        release_row = min(release_row, self.checkpoint.saved_rows)
+                    self.buffer.release(release_row)
+                if self.progress is not None:
+                    self.progress(i, self.total_frame_num)
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
@@ -0,0 +1,114 @@
+import cv2
+import numpy as np
+
+from behavior_senpai import detect_pipeline, track_buffer
+
+
+class DetectorBase:
+    """
+    検出器の共通部分
+    フレームの読み込み、バッチ、ROI、縮小、表示、結果の詰め込みはDetectorBaseとDetectPipelineが受け持ち、
+    サブクラスは推論と結果の変換だけを実装する
+        infer_batch(frames) -> results: framesと同じ長さの推論結果のリスト
+        to_keypoints(result) -> [(member_ids, keypoints), ...]
+            keypointsは(members, keypoints, len(columns))の配列、座標はinfer_batch()に渡したframeのpixel
+            memberごとにkeypointの数が違うときは複数に分けて返す
+        draw(frame, result) -> frame: 画面表示用
+    """
+
+    # track fileのカラム(timestamp以外)、x, y(とz)は元の動画の座標に戻してから詰める
+    columns = ["x", "y"]
+    member_dtype = np.int64
+    # columnsのdtype、検出器ごとに今までのtrack fileと同じdtypeにする
+    value_dtype = np.float64
+
+    def __init__(self, show=True, batch_size=1):
+        self.show = show
+        # progress(frame_num, total_frame_num)を後処理スレッドから呼ぶ
+        self.progress = None
+        # 1回のinfer_batch()にまとめて渡すフレーム数
+        self.batch_size = max(1, int(batch_size))
+
+    def reset(self):
+        """
+        別の動画を検出する前に呼ぶ、動画をまたいで残る状態があればサブクラスで消す
+        """
+        pass
+
+    def detect_person_boxes(self, frame):
+        """
+        RoiCap.auto_roi()用、frameの人物のbbox(N, 4: left, top, right, bottom)を返す
+        """
+        raise NotImplementedError
+
+    def infer_batch(self, frames):
+        raise NotImplementedError
+
+    def to_keypoints(self, result):
+        raise NotImplementedError
+
+    def draw(self, frame, result):
+        return frame
+
+    def set_cap(self, cap):
+        self.cap = cap
+        self.total_frame_num = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    def detect(self, roi=False, start_frame=0, end_frame=None, checkpoint=None, stride=1, motion_threshold=0, infer_size=None, store=None):
+        # データの初期化
+        self.buffer = track_buffer.TrackBuffer(self.columns, member_dtype=self.member_dtype, value_dtype=self.value_dtype)
+        self.roi = roi
+        pipeline = detect_pipeline.DetectPipeline(
+            self.cap,
+            self.total_frame_num,
+            roi=roi,
+            show=self.show,
+            batch_size=self.batch_size,
+            progress=self.progress,
+            start_frame=start_frame,
+            end_frame=end_frame,
+            buffer=self.buffer,
+            checkpoint=checkpoint,
+            stride=stride,
+            motion_threshold=motion_threshold,
+            infer_size=infer_size,
+            store=store,
+        )
+        # infer_batch()に渡すframeの大きさと、元の大きさに対する倍率
+        if roi is True:
+            self.infer_frame_size = (self.cap.roi_width, self.cap.roi_height)
+        else:
+            self.infer_frame_size = (self.frame_width, self.frame_height)
+        if pipeline.infer_frame_size is not None:
+            self.infer_frame_size = pipeline.infer_frame_size
+        self.infer_scale = pipeline.infer_scale
+        pipeline.run(self.infer_batch, self._extract, self.draw)
+        self.frame_timestamps = pipeline.frame_timestamps
+        self.motion_skipped_num = pipeline.motion_skipped_num
+
+        # memberとkeypointはここではintで保持する、indexでソートしたくなるかもしれないので
+        if store is None:
+            self.dst_df = self.buffer.to_dataframe()
+        else:
+            self.dst_df = store.finish(self.buffer)
+
+    def get_result(self):
+        return self.dst_df
+
+    def _extract(self, i, result, timestamp):
+        # x, zは横、yは縦の倍率で元のframeの座標に戻し、ROIのoffsetを足す
+        scale = np.ones(len(self.columns), dtype=np.float64)
+        offset = np.zeros(len(self.columns), dtype=np.float64)
+        for col, axis in (("x", 0), ("y", 1), ("z", 0)):
+            if col in self.columns:
+                scale[self.columns.index(col)] = self.infer_scale[axis]
+        if self.roi is True:
+            offset[self.columns.index("x")] = self.cap.left_top_point[0]
+            offset[self.columns.index("y")] = self.cap.left_top_point[1]
+
+        # データの詰め込み
+        for member_ids, keypoints in self.to_keypoints(result):
+            keypoints = np.asarray(keypoints, dtype=np.float64) / scale + offset
+            self.buffer.append(i, member_ids, keypoints, timestamp)
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class FrameTimeIndex:
+    """
+    track fileのtimestamp(とframe)の対応表、一度作ればmsecから一番近いフレームをsearchsortedで探せる
+    timestampsは並んでいなくてもよい、nearest_idx()は渡したtimestampsでの位置を返す
+    """
+
+    def __init__(self, timestamps, frames=None):
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.order = np.argsort(timestamps, kind="stable")
+        self.timestamps = timestamps[self.order]
+        self.frames = None if frames is None else np.asarray(frames)[self.order]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _nearest_pos(self, msec):
+        # 等距離なら前のフレーム、np.fabs(timestamps - msec).argmin()と同じ
+        pos = int(np.searchsorted(self.timestamps, msec, side="left"))
+        if pos >= len(self.timestamps):
+            return len(self.timestamps) - 1
+        if pos > 0 and msec - self.timestamps[pos - 1] <= self.timestamps[pos] - msec:
+            return pos - 1
+        return pos
+
+    def nearest_idx(self, msec):
+        """
+        msecに一番近いtimestampの、渡したtimestampsでの位置
+        """
+        return int(self.order[self._nearest_pos(msec)])
+
+    def nearest_msec(self, msec):
+        return self.timestamps[self._nearest_pos(msec)]
+
+    def frame_range(self, time_min=None, time_max=None):
+        """
+        time_min以上time_max以下のtimestampを持つframeの範囲を(最初のframe, 最後のframe + 1)で返す
+        """
+        start = 0 if time_min is None else int(np.searchsorted(self.timestamps, time_min, side="left"))
+        stop = len(self.timestamps) if time_max is None else int(np.searchsorted(self.timestamps, time_max, side="right"))
+        return int(self.frames[start]), int(self.frames[stop - 1]) + 1
+
+
+def from_track(src_df):
+    """
+    track file(index: frame, member, keypoint)からframeごとのtimestampの対応表を作る
+    """
+    frame_df = src_df.reset_index()[["frame", "timestamp"]].drop_duplicates("frame")
+    return FrameTimeIndex(frame_df["timestamp"].to_numpy(), frames=frame_df["frame"].to_numpy())
@@ -2,6 +2,7 @@ import time
 
 import numpy as np
 import pandas as pd
+from scipy.optimize import linear_sum_assignment
 from sklearn.decomposition import PCA
 from sklearn.metrics.pairwise import pairwise_distances
 from umap import UMAP
@@ -101,6 +102,155 @@ def thinning(src_df, thinning: int):
     return thinned_df
 
 
+def interpolate_frames(src_df, max_gap: int, frame_timestamps=None, zero_point=(0, 0)):
+    """
+    frameを間引いて検出したsrc_dfの抜けているframeをmemberごとに線形補間する
+    前後の検出結果の間隔がmax_gapより大きいところ(検出されていなかった区間)は補間しない
+    補間したframeにはそのmemberのkeypointを全て入れる、前後どちらかで検出されていないkeypoint
+    ((x, y)がzero_pointの点か行がない点)は(x, y)をzero_point、それ以外の列をNaNにする
+    frame_timestamps: frameをindexとするtimestampのSeries、なければ前後のtimestampを線形補間する
+    """
+    if max_gap <= 1 or len(src_df) == 0:
+        return src_df
+    value_cols = [col for col in src_df.columns if col != "timestamp"]
+    long_df = src_df.reset_index()
+
+    # memberごとに次に検出されたframeまでの間隔が2以上max_gap以下のところを補間する
+    span_df = long_df[["member", "frame", "timestamp"]].drop_duplicates(["member", "frame"])
+    span_df = span_df.sort_values(["member", "frame"], kind="stable")
+    span_df["next_frame"] = span_df.groupby("member", sort=False)["frame"].shift(-1)
+    span_df["next_timestamp"] = span_df.groupby("member", sort=False)["timestamp"].shift(-1)
+    gaps = span_df["next_frame"] - span_df["frame"]
+    span_df = span_df.loc[(gaps > 1) & (gaps <= max_gap)]
+    if len(span_df) == 0:
+        return src_df
+    span_df = span_df.astype({"next_frame": long_df["frame"].dtype})
+
+    # memberのkeypointを全て並べ、前後のframeの値を付ける
+    member_keypoints = long_df[["member", "keypoint"]].drop_duplicates()
+    block_df = span_df.merge(member_keypoints, on="member", how="left")
+    values_df = long_df[["member", "keypoint", "frame", *value_cols]]
+    block_df = block_df.merge(values_df, on=["member", "keypoint", "frame"], how="left")
+    next_values_df = values_df.rename(columns={"frame": "next_frame", **{col: f"next_{col}" for col in value_cols}})
+    block_df = block_df.merge(next_values_df, on=["member", "keypoint", "next_frame"], how="left")
+
+    values = block_df[value_cols].to_numpy(dtype=np.float64)
+    next_values = block_df[[f"next_{col}" for col in value_cols]].to_numpy(dtype=np.float64)
+    x_idx, y_idx = value_cols.index("x"), value_cols.index("y")
+    is_valid = ~(np.isnan(values[:, x_idx]) | np.isnan(next_values[:, x_idx]))
+    is_valid &= ~((values[:, x_idx] == zero_point[0]) & (values[:, y_idx] == zero_point[1]))
+    is_valid &= ~((next_values[:, x_idx] == zero_point[0]) & (next_values[:, y_idx] == zero_point[1]))
+
+    frames = block_df["frame"].to_numpy()
+    gaps = block_df["next_frame"].to_numpy() - frames
+    fill_nums = gaps - 1
+    src_rows = np.repeat(np.arange(len(block_df)), fill_nums)
+    steps = np.arange(fill_nums.sum()) - np.repeat(np.cumsum(fill_nums) - fill_nums, fill_nums) + 1
+    ratios = steps / gaps[src_rows]
+
+    new_values = values[src_rows] + (next_values[src_rows] - values[src_rows]) * ratios[:, np.newaxis]
+    is_missing = ~is_valid[src_rows]
+    new_values[is_missing] = np.nan
+    new_values[is_missing, x_idx] = zero_point[0]
+    new_values[is_missing, y_idx] = zero_point[1]
+    new_frames = frames[src_rows] + steps
+    timestamps = block_df["timestamp"].to_numpy(dtype=np.float64)
+    next_timestamps = block_df["next_timestamp"].to_numpy(dtype=np.float64)
+    new_timestamps = timestamps[src_rows] + (next_timestamps[src_rows] - timestamps[src_rows]) * ratios
+    if frame_timestamps is not None:
+        exact_timestamps = frame_timestamps.reindex(new_frames).to_numpy(dtype=np.float64)
+        new_timestamps = np.where(np.isnan(exact_timestamps), new_timestamps, exact_timestamps)
+
+    # 補間した行もsrc_dfと同じdtypeにする(RTMPoseはfloat32)
+    new_df = pd.DataFrame(new_values, columns=value_cols).astype(src_df[value_cols].dtypes.to_dict())
+    new_df.insert(0, "frame", new_frames)
+    new_df.insert(1, "member", block_df["member"].to_numpy()[src_rows])
+    new_df.insert(2, "keypoint", block_df["keypoint"].to_numpy()[src_rows])
+    new_df["timestamp"] = new_timestamps
+
+    dst_df = pd.concat([long_df, new_df], axis=0, ignore_index=True)
+    dst_df = dst_df.sort_values("frame", kind="stable").set_index(["frame", "member", "keypoint"])
+    dst_df = dst_df.loc[:, src_df.columns]
+    dst_df.attrs = src_df.attrs
+    return dst_df
+
+
+def stitch_shards(shard_dfs: list, boundaries: list, max_distance: float, zero_point=(0, 0)):
+    """
+    動画を時間で分割して検出したtrack DataFrameを1つにつなぐ
+    shard_dfs[k](k>=1)はboundaries[k-1]より前の数フレーム(overlap)も検出しておく
+    overlapのframeでkeypointの平均距離が小さいmember同士を対応付け(ハンガリアン法)、後ろのshardのmemberを前のshardのmemberに揃える
+    対応が付かなかったmemberには新しい番号を振る、memberが文字列(MediaPipe)のときは揃えない
+    overlapのframeは前のshardの結果を使う
+    """
+    dst_df = shard_dfs[0]
+    for next_df, boundary in zip(shard_dfs[1:], boundaries):
+        if len(next_df) == 0:
+            continue
+        if len(dst_df) > 0 and pd.api.types.is_integer_dtype(next_df.index.get_level_values("member")):
+            mapping = _match_members(dst_df, next_df, boundary, max_distance, zero_point)
+            next_df = next_df.rename(index=mapping, level="member")
+        next_df = next_df.loc[next_df.index.get_level_values("frame") >= boundary]
+        dst_df = pd.concat([dst_df, next_df], axis=0)
+    dst_df.attrs = shard_dfs[0].attrs
+    return dst_df
+
+
+def stitch_resumed(prev_df, next_df, max_distance: float, zero_point=(0, 0)):
+    """
+    checkpointから再開して検出したnext_dfをprev_dfの後ろにつなぐ
+    再開するとtrackerの状態が消えてmemberの番号が振り直されるので、prev_dfの最後のframeとnext_dfの最初のframeで
+    keypointの平均距離が小さいmember同士を対応付け、next_dfのmemberをprev_dfのmemberに揃える
+    """
+    if len(prev_df) > 0 and len(next_df) > 0 and pd.api.types.is_integer_dtype(next_df.index.get_level_values("member")):
+        prev_frames = prev_df.index.get_level_values("frame")
+        next_start = next_df.index.get_level_values("frame").min()
+        # prev_dfの最後のframeをnext_dfの最初のframeとして重ね、stitch_shards()と同じ方法で対応付ける
+        last_df = prev_df.loc[prev_frames == prev_frames.max()]
+        last_df = last_df.rename(index={prev_frames.max(): next_start}, level="frame")
+        mapping = _match_members(pd.concat([prev_df, last_df]), next_df, next_start + 1, max_distance, zero_point)
+        next_df = next_df.rename(index=mapping, level="member")
+    dst_df = pd.concat([prev_df, next_df], axis=0)
+    dst_df.attrs = next_df.attrs
+    return dst_df
+
+
+def _match_members(prev_df, next_df, boundary: int, max_distance: float, zero_point=(0, 0)):
+    """
+    next_dfのboundaryより前のframe(overlap)でprev_dfと比べ、{next_dfのmember: 揃えたmember}を返す
+    """
+
+    def _overlap_points(src_df):
+        tar_df = src_df.loc[src_df.index.get_level_values("frame") < boundary, ["x", "y"]].reset_index()
+        tar_df = tar_df.loc[tar_df["frame"] >= overlap_start]
+        is_valid = ~((tar_df["x"] == zero_point[0]) & (tar_df["y"] == zero_point[1]))
+        return tar_df.loc[is_valid]
+
+    next_members = next_df.index.get_level_values("member").unique()
+    overlap_start = next_df.index.get_level_values("frame").min()
+    pair_df = pd.merge(_overlap_points(prev_df), _overlap_points(next_df), on=["frame", "keypoint"], suffixes=("_prev", "_next"))
+    pair_df["distance"] = np.sqrt((pair_df["x_prev"] - pair_df["x_next"]) ** 2 + (pair_df["y_prev"] - pair_df["y_next"]) ** 2)
+    cost_df = pair_df.groupby(["member_next", "member_prev"])["distance"].mean().unstack()
+
+    mapping = {}
+    if len(cost_df) > 0:
+        cost_arr = cost_df.to_numpy()
+        # 同じkeypointが1つも重ならなかった組は対応付けない
+        cost_arr = np.where(np.isnan(cost_arr), max_distance * 1e3 + 1, cost_arr)
+        rows, cols = linear_sum_assignment(cost_arr)
+        for row, col in zip(rows, cols):
+            if cost_arr[row, col] <= max_distance:
+                mapping[cost_df.index[row]] = cost_df.columns[col]
+
+    # 対応が付かなかったmemberはprev_dfと重ならない番号にする
+    new_member = int(prev_df.index.get_level_values("member").max()) + 1
+    for member in next_members:
+        if member not in mapping:
+            mapping[member] = new_member
+            new_member += 1
+    return mapping
+
+
 def pca(src_df, tar_cols: list):
     """
     PCA: principal component analysis(主成分分析)
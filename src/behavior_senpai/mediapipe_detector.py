@@ -1,105 +1,103 @@
 import cv2
 import mediapipe as mp
-import pandas as pd
+import numpy as np
 
-from behavior_senpai import img_draw, vcap
+from behavior_senpai import detector_base
 
+# componentsごとに出力するmember
+COMPONENT_MEMBERS = {
+    "full": ["face", "right_hand", "left_hand", "pose"],
+    "pose_hands": ["right_hand", "left_hand", "pose"],
+    "pose": ["pose"],
+}
 
-class MediaPipeDetector:
-    def __init__(self, show=True):
-        self.mph = mp.solutions.holistic
-        self.model = self.mph.Holistic(model_complexity=2, refine_face_landmarks=True)
-
-        self.number_of_keypoints = {"face": 478, "right_hand": 21, "left_hand": 21, "pose": 33}
-        self.show = show
-        if self.show is True:
-            self.drawing = mp.solutions.drawing_utils
 
-    def set_cap(self, cap):
-        self.cap = cap
-        self.total_frame_num = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        self.frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+class MediaPipeDetector(detector_base.DetectorBase):
+    columns = ["x", "y", "z"]
+    # memberは"face", "pose"などの文字列
+    member_dtype = object
 
-    def detect(self, roi=False):
-        # データの初期化
-        data_dict = {"frame": [], "member": [], "keypoint": [], "x": [], "y": [], "z": [], "timestamp": []}
-        for i in range(self.total_frame_num):
-            if roi is True:
-                ret, frame = self.cap.get_roi_frame()
-            else:
-                ret, frame = self.cap.read()
-            if ret is False:
-                print("Failed to read frame.")
-                continue
-            rgb_img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = self.model.process(rgb_img)
-            timestamp = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+    def __init__(self, show=True, components="full", model_complexity=2):
+        """
+        components: 出力するmemberの組み合わせ、COMPONENT_MEMBERSのkey
+            "pose"ならPose、それ以外はHolisticを使う
+            Holisticはfaceを省けないので、"pose_hands"では細かいface(refine_face_landmarks)を省いて出力しない
+        model_complexity: 0, 1, 2、小さいほど速いが精度は下がる
+        """
+        super().__init__(show=show)
+        self.mph = mp.solutions.holistic
+        self.components = components
+        self.model_complexity = model_complexity
+        self.member_ids = COMPONENT_MEMBERS[components]
+        if components == "pose":
+            self.model = mp.solutions.pose.Pose(model_complexity=model_complexity)
+        else:
+            self.model = self.mph.Holistic(model_complexity=model_complexity, refine_face_landmarks=components == "full")
 
-            # 検出結果を描画、xキーで途中終了
-            if self.show is True:
-                self._draw(frame, results)
-                _, frame = vcap.resize_frame(frame)
-                img_draw.put_frame_pos(frame, i, self.total_frame_num)
-                img_draw.put_message(frame, "'x' key to exit.", font_size=1.5, y=55)
-                cv2.imshow("dst", frame)
-                key = cv2.waitKey(1) & 0xFF
-                if key == ord("x"):
-                    break
+        self.number_of_keypoints = {"face": 478, "right_hand": 21, "left_hand": 21, "pose": 33}
+        self.drawing = mp.solutions.drawing_utils
 
-            # 検出結果の取り出し
-            member_ids = ["face", "right_hand", "left_hand", "pose"]
-            for member_id in member_ids:
-                landmarks = getattr(results, f"{member_id}_landmarks")
-                if landmarks is None:
-                    continue
-                keypoints = landmarks.landmark
+    def reset(self):
+        """
+        別の動画を検出する前に呼ぶ、前の動画のlandmarkの追跡状態が残らないようにgraphを作り直す
+        """
+        self.model.reset()
 
-                for k in range(self.number_of_keypoints[member_id]):
-                    keypoint_id = k
-                    if roi is True:
-                        x = float(keypoints[k].x * self.cap.roi_width + self.cap.left_top_point[0])
-                        y = float(keypoints[k].y * self.cap.roi_height + self.cap.left_top_point[1])
-                        z = float(keypoints[k].z * self.cap.roi_width)
-                    else:
-                        x = float(keypoints[k].x * self.frame_width)
-                        y = float(keypoints[k].y * self.frame_height)
-                        z = float(keypoints[k].z * self.frame_width)
+    def detect_person_boxes(self, frame):
+        """
+        RoiCap.auto_roi()用、Holisticには人物検出がないのでposeのlandmarkを囲む矩形をbboxとして返す
+        """
+        rgb_img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        results = self.model.process(rgb_img)
+        if results.pose_landmarks is None:
+            return np.zeros((0, 4), dtype=np.float64)
+        keypoints = np.array([(kp.x, kp.y) for kp in results.pose_landmarks.landmark], dtype=np.float64).clip(0, 1)
+        keypoints *= (frame.shape[1], frame.shape[0])
+        return np.concatenate((keypoints.min(axis=0), keypoints.max(axis=0)))[np.newaxis]
 
-                    # データの詰め込み
-                    data_dict["frame"].append(i)
-                    data_dict["member"].append(member_id)
-                    data_dict["keypoint"].append(keypoint_id)
-                    data_dict["x"].append(x)
-                    data_dict["y"].append(y)
-                    data_dict["z"].append(z)
-                    data_dict["timestamp"].append(timestamp)
+    def infer_batch(self, frames):
+        results = []
+        for frame in frames:
+            rgb_img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            results.append(self.model.process(rgb_img))
+        return results
 
-        # keypointはここではintで保持する、indexでソートしたくなるかもしれないので
-        self.dst_df = pd.DataFrame(data_dict).set_index(["frame", "member", "keypoint"])
-        cv2.destroyAllWindows()
+    def to_keypoints(self, results):
+        # 正規化座標をinfer_batch()に渡したframeのpixelにする
+        size = np.array([self.infer_frame_size[0], self.infer_frame_size[1], self.infer_frame_size[0]], dtype=np.float64)
 
-    def get_result(self):
-        return self.dst_df
+        # 検出結果の取り出し、memberごとにkeypointの数が違うので別々に返す
+        blocks = []
+        for member_id in self.member_ids:
+            landmarks = getattr(results, f"{member_id}_landmarks")
+            if landmarks is None:
+                continue
+            keypoints = landmarks.landmark[: self.number_of_keypoints[member_id]]
+            keypoints = np.array([(kp.x, kp.y, kp.z) for kp in keypoints], dtype=np.float64) * size
+            blocks.append(([member_id], keypoints[np.newaxis]))
+        return blocks
 
-    def _draw(self, anno_img, results):
+    def draw(self, anno_img, results):
+        """
+        anno_imgに直接描画して返す、Poseの結果にはfaceとhandがないのでgetattr()で取る
+        """
         self.drawing.draw_landmarks(
             anno_img,
-            results.face_landmarks,
+            getattr(results, "face_landmarks", None),
             self.mph.FACEMESH_TESSELATION,
             self.drawing.DrawingSpec(color=(250, 0, 50), thickness=1, circle_radius=1),
             self.drawing.DrawingSpec(color=(180, 180, 180), thickness=1, circle_radius=1),
         )
         self.drawing.draw_landmarks(
             anno_img,
-            results.right_hand_landmarks,
+            getattr(results, "right_hand_landmarks", None),
             self.mph.HAND_CONNECTIONS,
             self.drawing.DrawingSpec(color=(10, 190, 50), thickness=1, circle_radius=1),
             self.drawing.DrawingSpec(color=(180, 180, 180), thickness=1, circle_radius=1),
         )
         self.drawing.draw_landmarks(
             anno_img,
-            results.left_hand_landmarks,
+            getattr(results, "left_hand_landmarks", None),
             self.mph.HAND_CONNECTIONS,
             self.drawing.DrawingSpec(color=(10, 50, 200), thickness=1, circle_radius=1),
             self.drawing.DrawingSpec(color=(180, 180, 180), thickness=1, circle_radius=1),
@@ -111,3 +109,4 @@ class MediaPipeDetector:
             self.drawing.DrawingSpec(color=(50, 50, 250), thickness=1, circle_radius=1),
             self.drawing.DrawingSpec(color=(180, 180, 180), thickness=1, circle_radius=1),
         )
+        return anno_img
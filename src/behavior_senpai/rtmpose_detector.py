@@ -1,6 +1,7 @@
+import time
+
 import cv2
 import numpy as np
-import pandas as pd
 from mmdet.apis import inference_detector, init_detector
 from mmengine.registry import init_default_scope
 from mmpose.apis import inference_topdown, init_model
@@ -8,11 +9,21 @@ from mmpose.evaluation.functional import nms
 from mmpose.registry import VISUALIZERS
 from mmpose.structures import merge_data_samples
 
-from behavior_senpai import img_draw, vcap
+from behavior_senpai import detector_base
+
 
+class RTMPoseDetector(detector_base.DetectorBase):
+    columns = ["x", "y", "visible", "score"]
+    # mmposeの出力のままfloat32で保存する
+    value_dtype = np.float32
 
-class RTMPoseDetector:
-    def __init__(self, whole_body=False, show=True):
+    def __init__(self, whole_body=False, show=True, bbox_interval=1, bbox_audit=False):
+        """
+        bbox_interval: bbox検出(RTMDet)をbbox_intervalフレームに1回にする
+            間のフレームは前のフレームのkeypointから作ったbboxを使う、keypointのscoreが低いときはすぐにbbox検出する
+        bbox_audit: Trueにするとbboxを使い回したフレームでもbbox検出をして、IoUを比較する(速くはならない)
+        """
+        super().__init__(show=show)
         if whole_body is True:
             config = "./mm_config/rtmpose-x_8xb32-270e_coco-wholebody-384x288.py"
             checkpoint = "https://download.openmmlab.com/mmpose/v1/projects/rtmposev1/rtmpose-x_simcc-coco-wholebody_pt-body7_270e-384x288-401dfc90_20230629.pth"
@@ -32,87 +43,176 @@ class RTMPoseDetector:
         self.pose_score_threshold = 0.3
         self.retain_threshold = 0.3
         self.det_cat_id = 0
-        self.show = show
-
-    def set_cap(self, cap):
-        self.cap = cap
-        self.total_frame_num = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        self.frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-    def detect(self, roi=False):
-        # データの初期化
-        data_dict = {"frame": [], "member": [], "keypoint": [], "x": [], "y": [], "visible": [], "score": [], "timestamp": []}
-        for i in range(self.total_frame_num):
-            if roi is True:
-                ret, frame = self.cap.get_roi_frame()
-            else:
-                ret, frame = self.cap.read()
-            if ret is False:
-                print("Failed to read frame.")
-                continue
-            rgb_img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-            scope = self.det_model.cfg.get("default_scope", "mmdet")
-            if scope is not None:
-                init_default_scope(scope)
-            # bbox検出
-            det_result = inference_detector(self.det_model, rgb_img)
-            pred_instance = det_result.pred_instances.cpu().numpy()
-            bboxes = np.concatenate((pred_instance.bboxes, pred_instance.scores[:, None]), axis=1)
-            bboxes = bboxes[np.logical_and(pred_instance.labels == self.det_cat_id, pred_instance.scores > self.det_score_threshold)]
-            bboxes = bboxes[nms(bboxes, self.retain_threshold), :4]
-            # x座標でソート
-            bboxes = bboxes[bboxes[:, 0].argsort()]
-            # keypoint検出
-            results = inference_topdown(self.pose_model, rgb_img, bboxes)
+        self.bbox_interval = max(1, int(bbox_interval))
+        self.bbox_audit = bbox_audit
+        # keypointから作るbboxの拡大率と、bboxを使い回すためのkeypointのscoreの下限
+        self.bbox_expand = 1.25
+        self.bbox_reuse_score = 0.5
+
+    def reset(self):
+        """
+        別の動画を検出する前に呼ぶ、使い回していたbboxを捨てる
+        """
+        self._reset_bbox_reuse()
+
+    def detect_person_boxes(self, frame):
+        """
+        RoiCap.auto_roi()用、frameの人物のbbox(N, 4: left, top, right, bottom)を返す
+        """
+        rgb_img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return self._detect_bboxes(rgb_img)
+
+    def detect(self, *args, **kwargs):
+        self._reset_bbox_reuse()
+        super().detect(*args, **kwargs)
+        if self.bbox_interval > 1 or self.bbox_audit is True:
+            print(self.bbox_reuse_report())
+
+    def infer_batch(self, frames):
+        return [self._infer_frame(frame) for frame in frames]
+
+    def _infer_frame(self, frame):
+        rgb_img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+        # bbox検出、前のフレームのkeypointから作ったbboxが使えるときは使い回す
+        if self._need_bbox_detection() is True:
+            bboxes = self._detect_bboxes(rgb_img)
+            if self.prev_bboxes is not None:
+                self._compare_bboxes(self.prev_bboxes, bboxes)
+            self.frames_since_det = 0
+        else:
+            bboxes = self.prev_bboxes
+            if self.bbox_audit is True:
+                self._compare_bboxes(bboxes, self._detect_bboxes(rgb_img, audit=True))
+            self.stats["reuse_num"] += 1
+
+        # keypoint検出、人ごとの結果を1つにまとめてからhostに移す
+        start_time = time.perf_counter()
+        results = inference_topdown(self.pose_model, rgb_img, bboxes)
+        data_samples = None
+        if len(results) > 0:
             data_samples = merge_data_samples(results)
-            timestamp = self.cap.get(cv2.CAP_PROP_POS_MSEC)
-
-            # 検出結果を描画、xキーで途中終了
-            if self.show is True:
-                frame = self._draw(frame, data_samples)
-                _, frame = vcap.resize_frame(frame)
-                img_draw.put_frame_pos(frame, i, self.total_frame_num)
-                img_draw.put_message(frame, "'x' key to exit.", font_size=1.5, y=55)
-                cv2.imshow("dst", frame)
-                key = cv2.waitKey(1) & 0xFF
-                if key == ord("x"):
-                    break
-
-            # 検出結果の取り出し
-            for member_id, keypoints in enumerate(results):
-                pred_instance = keypoints.pred_instances.cpu().numpy()
-                pred_instance.keypoints[pred_instance.keypoint_scores < self.pose_score_threshold] = 0
-                result_keypoints = np.concatenate(
-                    (pred_instance.keypoints[0, :], pred_instance.keypoints_visible.T, pred_instance.keypoint_scores.T), axis=1
-                )
-                for k in range(self.number_of_keypoints):
-                    keypoint_id = k
-                    x = result_keypoints[k][0]
-                    y = result_keypoints[k][1]
-                    if roi is True:
-                        x += self.cap.left_top_point[0]
-                        y += self.cap.left_top_point[1]
-                    visible = result_keypoints[k][2]
-                    score = result_keypoints[k][3]
-
-                    # データの詰め込み
-                    data_dict["frame"].append(i)
-                    data_dict["member"].append(member_id)
-                    data_dict["keypoint"].append(keypoint_id)
-                    data_dict["x"].append(x)
-                    data_dict["y"].append(y)
-                    data_dict["visible"].append(visible)
-                    data_dict["score"].append(score)
-                    data_dict["timestamp"].append(timestamp)
-
-        # keypointはここではintで保持する、indexでソートしたくなるかもしれないので
-        self.dst_df = pd.DataFrame(data_dict).set_index(["frame", "member", "keypoint"])
-        cv2.destroyAllWindows()
-
-    def get_result(self):
-        return self.dst_df
+            data_samples.pred_instances = data_samples.pred_instances.cpu().numpy()
+        self.stats["pose_sec"] += time.perf_counter() - start_time
+
+        self.prev_bboxes = self._bboxes_from_results(data_samples, rgb_img.shape)
+        self.frames_since_det += 1
+        return data_samples
+
+    def _detect_bboxes(self, rgb_img, audit=False):
+        start_time = time.perf_counter()
+        scope = self.det_model.cfg.get("default_scope", "mmdet")
+        if scope is not None:
+            init_default_scope(scope)
+        det_result = inference_detector(self.det_model, rgb_img)
+        pred_instance = det_result.pred_instances.cpu().numpy()
+        bboxes = np.concatenate((pred_instance.bboxes, pred_instance.scores[:, None]), axis=1)
+        bboxes = bboxes[np.logical_and(pred_instance.labels == self.det_cat_id, pred_instance.scores > self.det_score_threshold)]
+        bboxes = bboxes[nms(bboxes, self.retain_threshold), :4]
+        # x座標でソート
+        bboxes = bboxes[bboxes[:, 0].argsort()]
+        self.stats["det_sec"] += time.perf_counter() - start_time
+        self.stats["audit_num" if audit is True else "det_num"] += 1
+        return bboxes
+
+    def _need_bbox_detection(self):
+        if self.bbox_interval <= 1 or self.prev_bboxes is None:
+            return True
+        if self.frames_since_det >= self.bbox_interval:
+            return True
+        # keypointが取れなかった人がいたり、誰もいなかったら検出し直す
+        if len(self.prev_bboxes) == 0 or len(self.prev_bboxes) < self.prev_member_num:
+            return True
+        return False
+
+    def _bboxes_from_results(self, data_samples, img_shape):
+        """
+        keypointを囲む矩形をbbox_expand倍に広げて次のフレームのbboxにする
+        scoreの高いkeypointが少ない人は除く
+        """
+        if data_samples is None:
+            self.prev_member_num = 0
+            return np.zeros((0, 4), dtype=np.float32)
+        keypoints = data_samples.pred_instances.keypoints
+        scores = data_samples.pred_instances.keypoint_scores
+        self.prev_member_num = len(keypoints)
+
+        is_valid = scores >= self.pose_score_threshold
+        is_reusable = (is_valid.sum(axis=1) >= 2) & (scores.mean(axis=1) >= self.bbox_reuse_score)
+        keypoints, is_valid = keypoints[is_reusable], is_valid[is_reusable]
+        if len(keypoints) == 0:
+            return np.zeros((0, 4), dtype=np.float32)
+        min_xy = np.where(is_valid[:, :, np.newaxis], keypoints, np.inf).min(axis=1)
+        max_xy = np.where(is_valid[:, :, np.newaxis], keypoints, -np.inf).max(axis=1)
+        center = (min_xy + max_xy) / 2
+        half_size = (max_xy - min_xy) / 2 * self.bbox_expand
+        bboxes = np.concatenate((center - half_size, center + half_size), axis=1).astype(np.float32)
+        bboxes[:, [0, 2]] = bboxes[:, [0, 2]].clip(0, img_shape[1] - 1)
+        bboxes[:, [1, 3]] = bboxes[:, [1, 3]].clip(0, img_shape[0] - 1)
+        return bboxes[bboxes[:, 0].argsort()]
+
+    def _compare_bboxes(self, reused_bboxes, detected_bboxes):
+        """
+        使い回したbboxと検出したbboxのIoUを記録する(bbox_reuse_report()用)
+        検出したbboxごとに、IoUが最大の使い回したbboxとのIoUをとる
+        """
+        self.stats["compare_num"] += 1
+        if len(detected_bboxes) != len(reused_bboxes):
+            self.stats["count_mismatch_num"] += 1
+        if len(detected_bboxes) == 0:
+            return
+        if len(reused_bboxes) == 0:
+            self.stats["ious"].extend([0.0] * len(detected_bboxes))
+            return
+        a = detected_bboxes[:, np.newaxis, :]
+        b = reused_bboxes[np.newaxis, :, :]
+        inter_w = (np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])).clip(0)
+        inter_h = (np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])).clip(0)
+        inter = inter_w * inter_h
+        area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+        area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+        ious = inter / np.maximum(area_a + area_b - inter, 1e-6)
+        self.stats["ious"].extend(ious.max(axis=1).tolist())
+
+    def _reset_bbox_reuse(self):
+        self.prev_bboxes = None
+        self.prev_member_num = 0
+        self.frames_since_det = 0
+        self.stats = {
+            "det_num": 0,
+            "audit_num": 0,
+            "reuse_num": 0,
+            "det_sec": 0.0,
+            "pose_sec": 0.0,
+            "compare_num": 0,
+            "count_mismatch_num": 0,
+            "ious": [],
+        }
+
+    def bbox_reuse_report(self):
+        """
+        bboxを毎フレーム検出した場合(ベースライン)と比べた速度と精度の目安を返す
+        bbox検出したフレームでは、その直前に使い回していたbboxと検出結果を比べる(bbox_audit=Trueなら全フレームで比べる)
+        """
+        return bbox_reuse_report(self.stats, self.bbox_interval)
+
+    def draw(self, frame, data_samples):
+        if data_samples is None:
+            return frame
+        return self._draw(frame, data_samples)
+
+    def to_keypoints(self, data_samples):
+        # 検出結果の取り出し、全員分の(members, keypoints, channels)をまとめて作る
+        if data_samples is None:
+            return []
+        pred_instances = data_samples.pred_instances
+        keypoints = pred_instances.keypoints.astype(np.float64)
+        keypoints[pred_instances.keypoint_scores < self.pose_score_threshold] = 0
+        member_keypoints = np.concatenate(
+            (keypoints, pred_instances.keypoints_visible[:, :, np.newaxis], pred_instances.keypoint_scores[:, :, np.newaxis]), axis=2
+        )
+        member_ids = np.arange(len(member_keypoints))
+        return [(member_ids, member_keypoints)]
 
     def _draw(self, anno_img, data_samples):
         self.visualizer.add_datasample(
@@ -123,3 +223,39 @@ class RTMPoseDetector:
             draw_gt=False,
         )
         return self.visualizer.get_image()
+
+
+def merge_bbox_stats(stats_list):
+    """
+    時間で分割して検出したときに、shardごとのRTMPoseDetector.statsを足し合わせる
+    overlapのフレームは両方のshardで数える
+    """
+    merged = {key: [] if key == "ious" else 0 for key in stats_list[0]}
+    for stats in stats_list:
+        for key, value in stats.items():
+            merged[key] = merged[key] + value
+    return merged
+
+
+def bbox_reuse_report(stats, bbox_interval):
+    """
+    RTMPoseDetector.bbox_reuse_report()の中身、shardごとのstatsを足し合わせたものからも作れるように分けている
+    """
+    frame_num = stats["det_num"] + stats["reuse_num"]
+    det_sec_per_call = stats["det_sec"] / max(stats["det_num"] + stats["audit_num"], 1)
+    # audit用の検出時間は含めずに、毎フレーム検出した場合の時間と比べる
+    actual_sec = stats["pose_sec"] + det_sec_per_call * stats["det_num"]
+    baseline_sec = stats["pose_sec"] + det_sec_per_call * frame_num
+    report = {
+        "bbox_interval": bbox_interval,
+        "frames": frame_num,
+        "bbox_detections": stats["det_num"],
+        "bbox_reused": stats["reuse_num"],
+        "det_msec_per_call": round(det_sec_per_call * 1000, 2),
+        "pose_msec_per_frame": round(stats["pose_sec"] / max(frame_num, 1) * 1000, 2),
+        "estimated_speedup": round(baseline_sec / actual_sec, 2) if actual_sec > 0 else None,
+        "compared_frames": stats["compare_num"],
+        "count_mismatch_frames": stats["count_mismatch_num"],
+        "mean_iou": round(float(np.mean(stats["ious"])), 3) if len(stats["ious"]) > 0 else None,
+    }
+    return report
@@ -0,0 +1,54 @@
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+from behavior_senpai import detector_base
+
+
+class SyntheticDetector(detector_base.DetectorBase):
+    """
+    モデルの重みもGPUも使わない、読み込みから書き出しまでのテストとベンチマーク用の検出器
+    frameの画素から決まる疑似乱数でkeypointを作るので、同じframeには常に同じ結果を返す
+    sec_per_frameを指定すると推論の待ち時間を真似る
+    偽のtrack fileを書き出すのでdetector_procのエンジン一覧には入れない、exec()で試すときはregister_detector()で登録する
+    """
+
+    columns = ["x", "y", "conf"]
+
+    def __init__(self, show=True, batch_size=1, member_num=2, number_of_keypoints=17, sec_per_frame=0.0):
+        super().__init__(show=show, batch_size=batch_size)
+        self.member_num = member_num
+        self.number_of_keypoints = number_of_keypoints
+        self.sec_per_frame = sec_per_frame
+
+    def detect_person_boxes(self, frame):
+        keypoints = self._infer_frame(frame)
+        return np.concatenate((keypoints[:, :, :2].min(axis=1), keypoints[:, :, :2].max(axis=1)), axis=1)
+
+    def infer_batch(self, frames):
+        if self.sec_per_frame > 0:
+            time.sleep(self.sec_per_frame * len(frames))
+        return [self._infer_frame(frame) for frame in frames]
+
+    def to_keypoints(self, keypoints):
+        return [(np.arange(len(keypoints)), keypoints)]
+
+    def draw(self, frame, keypoints):
+        for x, y, _ in keypoints.reshape(-1, 3):
+            cv2.circle(frame, (int(x), int(y)), 4, (0, 255, 0), -1)
+        return frame
+
+    def _infer_frame(self, frame):
+        """
+        (members, keypoints, 3: x, y, conf)を返す、座標はframeのpixel
+        """
+        height, width = frame.shape[:2]
+        seed = zlib.crc32(np.ascontiguousarray(frame[::8, ::8]).tobytes())
+        rng = np.random.default_rng(seed)
+        centers = rng.random((self.member_num, 1, 2)) * (width, height)
+        offsets = rng.normal(scale=min(width, height) * 0.05, size=(self.member_num, self.number_of_keypoints, 2))
+        xy = (centers + offsets).clip(0, (width - 1, height - 1))
+        conf = rng.random((self.member_num, self.number_of_keypoints, 1))
+        return np.concatenate((xy, conf), axis=2)
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+
+class TrackBuffer:
+    """
+    検出結果を1フレーム分の(members x keypoints x channels)の配列ごと受け取り、列ごとのnumpy配列に詰めていく
+    配列が足りなくなったら倍の長さに拡張する
+    最後にMultiIndex(frame, member, keypoint)のtrack DataFrameを一括で作る
+    行番号(len(), to_dataframe()のstart, release()のupto)はrelease()で捨てた行も数えた通し番号
+    """
+
+    def __init__(self, columns: list, member_dtype=np.int64, value_dtype=np.float64, capacity=65536):
+        """
+        columns: x, y, confなどtimestamp以外のカラム名(keypointsの最後の軸の順)
+        member_dtype: MediaPipeのようにmemberが文字列のときはobject
+        value_dtype: columnsのdtype、track fileのカラムのdtypeになる(RTMPoseはfloat32)
+        """
+        self.columns = list(columns)
+        self.member_dtype = member_dtype
+        self.value_dtype = value_dtype
+        self.size = 0
+        # release()で捨てた行数
+        self.offset = 0
+        # 直前のframeの行の範囲と、いま詰めているframeの開始行(repeat_last_frame()用)
+        self.last_rows = (0, 0)
+        self.frame_start = 0
+        self.frame = np.empty(capacity, dtype=np.int64)
+        self.member = np.empty(capacity, dtype=member_dtype)
+        self.keypoint = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty((capacity, len(self.columns)), dtype=value_dtype)
+        self.timestamp = np.empty(capacity, dtype=np.float64)
+
+    def append(self, frame_num: int, member_ids, keypoints, timestamp: float):
+        """
+        member_ids: (members,)
+        keypoints: (members, keypoints, channels)
+        """
+        keypoints = np.asarray(keypoints)
+        if keypoints.ndim != 3 or keypoints.shape[0] == 0:
+            return
+        member_num, keypoint_num, _ = keypoints.shape
+        row_num = member_num * keypoint_num
+        self._reserve(row_num)
+
+        tar = slice(self.size, self.size + row_num)
+        self.frame[tar] = frame_num
+        self.member[tar] = np.repeat(np.asarray(member_ids, dtype=self.member_dtype), keypoint_num)
+        self.keypoint[tar] = np.tile(np.arange(keypoint_num), member_num)
+        self.values[tar] = keypoints.reshape(row_num, -1)
+        self.timestamp[tar] = timestamp
+        self.size += row_num
+
+    def begin_frame(self):
+        """
+        1フレーム分の結果を詰め始める前に呼ぶ
+        MediaPipeのように1フレームで複数回appendしても、直前のframeの行をまとめて覚えておける
+        """
+        self.last_rows = (self.frame_start, self.size)
+        self.frame_start = self.size
+
+    def repeat_last_frame(self, frame_num: int, timestamp: float):
+        """
+        直前のframeの結果をframe_numのframeの結果としてもう一度詰める
+        """
+        start, end = self.last_rows
+        row_num = end - start
+        if row_num == 0:
+            return
+        self._reserve(row_num)
+
+        src = slice(start, end)
+        tar = slice(self.size, self.size + row_num)
+        self.frame[tar] = frame_num
+        self.member[tar] = self.member[src]
+        self.keypoint[tar] = self.keypoint[src]
+        self.values[tar] = self.values[src]
+        self.timestamp[tar] = timestamp
+        self.size += row_num
+
+    def to_dataframe(self, start=0):
+        """
+        start行目以降をDataFrameにする(checkpointで差分だけ書き出すときに使う)
+        """
+        if start < self.offset:
+            raise ValueError(f"Rows before {self.offset} have already been released.")
+        tar = slice(start - self.offset, self.size)
+        index = pd.MultiIndex.from_arrays(
+            [self.frame[tar], self.member[tar], self.keypoint[tar]],
+            names=["frame", "member", "keypoint"],
+        )
+        data = {col: self.values[tar, i] for i, col in enumerate(self.columns)}
+        data["timestamp"] = self.timestamp[tar]
+        return pd.DataFrame(data, index=index)
+
+    def release(self, upto: int):
+        """
+        upto行目より前の行をメモリから捨てる(TrackStoreに書き出し済みの行用)
+        いま詰めているframeの行はrepeat_last_frame()で使うので残す
+        """
+        release_num = min(upto - self.offset, self.frame_start)
+        if release_num <= 0:
+            return
+        remain_num = self.size - release_num
+        for arr in (self.frame, self.member, self.keypoint, self.values, self.timestamp):
+            arr[:remain_num] = arr[release_num : self.size]
+        self.size = remain_num
+        self.offset += release_num
+        self.frame_start -= release_num
+        self.last_rows = (max(self.last_rows[0] - release_num, 0), max(self.last_rows[1] - release_num, 0))
+
+    def __len__(self):
+        return self.offset + self.size
+
+    def _reserve(self, row_num):
+        required = self.size + row_num
+        capacity = len(self.frame)
+        if required <= capacity:
+            return
+        while capacity < required:
+            capacity *= 2
+        self.frame = self._extend(self.frame, capacity)
+        self.member = self._extend(self.member, capacity)
+        self.keypoint = self._extend(self.keypoint, capacity)
+        self.values = self._extend(self.values, capacity)
+        self.timestamp = self._extend(self.timestamp, capacity)
+
+    def _extend(self, src_arr, capacity):
+        dst_arr = np.empty((capacity,) + src_arr.shape[1:], dtype=src_arr.dtype)
+        dst_arr[: self.size] = src_arr[: self.size]
+        return dst_arr
@@ -0,0 +1,64 @@
+import os
+
+import pandas as pd
+
+
+class TrackStore:
+    """
+    検出結果をchunk_framesごとにtrack fileの隣(trk/xxx.partial.h5)のHDF5(table形式)へ追記していく
+    書き出した行はTrackBufferから捨てるので、長い動画でもメモリに溜まる行数はchunk_frames分程度になる
+    追記のたびにファイルを閉じるので、検出中でもread()で途中までの結果を読める
+    最後にfinish()で全体を読み出してtrack file(pkl)を作る
+    """
+
+    key = "track"
+
+    def __init__(self, pkl_path, chunk_frames=1000):
+        self.path = f"{os.path.splitext(pkl_path)[0]}.partial.h5"
+        self.chunk_frames = chunk_frames
+        self.saved_rows = 0
+        self.saved_frame = -1
+
+    def start(self, start_frame=0):
+        self.saved_rows = 0
+        self.saved_frame = start_frame - 1
+        self.remove()
+
+    def update(self, frame_num, buffer):
+        """
+        前回の書き出しからchunk_frames以上進んでいたら、増えた分の行を追記する
+        """
+        if frame_num - self.saved_frame < self.chunk_frames:
+            return
+        self._append(buffer)
+        self.saved_frame = frame_num
+
+    def finish(self, buffer):
+        """
+        残りの行を追記して、全体をtrack DataFrameとして返す
+        """
+        self._append(buffer)
+        return self.read()
+
+    def read(self):
+        if os.path.exists(self.path) is False:
+            return None
+        with pd.HDFStore(self.path, mode="r") as store:
+            if f"/{self.key}" not in store.keys():
+                return None
+            src_df = store.select(self.key)
+        return src_df.set_index(["frame", "member", "keypoint"])
+
+    def remove(self):
+        if os.path.exists(self.path) is True:
+            os.remove(self.path)
+
+    def _append(self, buffer):
+        if len(buffer) <= self.saved_rows:
+            return
+        rows = buffer.to_dataframe(start=self.saved_rows).reset_index()
+        # MediaPipeのmemberは文字列なので、あとのchunkでも収まる長さを確保しておく
+        min_itemsize = {"member": 32} if rows["member"].dtype == object else None
+        with pd.HDFStore(self.path, mode="a") as store:
+            store.append(self.key, rows, format="table", index=False, min_itemsize=min_itemsize)
+        self.saved_rows = len(buffer)
@@ -1,7 +1,50 @@
+import threading
+from collections import OrderedDict
+
 import cv2
 import numpy as np
 
-from behavior_senpai import img_draw
+from behavior_senpai import img_draw, video_index, video_meta, video_proxy
+
+
+class FrameCache:
+    """
+    デコードしたフレームのLRUキャッシュ、同じところを行き来したときにseekとdecodeをやり直さない
+    合計のバイト数がmax_bytesを超えたら、最後に使ってから一番時間が経ったものから捨てる
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key not in self.items:
+            self.misses += 1
+            return None
+        self.items.move_to_end(key)
+        self.hits += 1
+        return self.items[key]
+
+    def put(self, key, frame, msec):
+        if frame.nbytes > self.max_bytes:
+            return
+        if key in self.items:
+            self.total_bytes -= self.items.pop(key)[0].nbytes
+        self.items[key] = (frame, msec)
+        self.total_bytes += frame.nbytes
+        while self.total_bytes > self.max_bytes:
+            _, (old_frame, _) = self.items.popitem(last=False)
+            self.total_bytes -= old_frame.nbytes
+
+    def clear(self):
+        self.items.clear()
+        self.total_bytes = 0
+
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses, "frames": len(self.items), "bytes": self.total_bytes}
 
 
 class VideoCap(cv2.VideoCapture):
@@ -9,6 +52,19 @@ class VideoCap(cv2.VideoCapture):
         super().__init__()
         self.frame_size = (0, 0)
         self.max_msec = 0
+        self.meta = None
+        self.video_index = None
+        # 索引はseekで初めて必要になったときに読み込むか作る
+        self.is_index_pending = False
+        self.frame_cache = FrameCache()
+        # 最後にread_at()したフレームのmsec
+        self.read_msec = 0
+        self.decoded = False
+        # 今の位置からこのmsec以内の先へはseekせずにgrab()で進める
+        self.grab_window_msec = 1000
+        # proxy/に小さな動画があれば、read_at()はそちらから読む(read_anyway()などの連続読み込みは元の動画から)
+        self.use_proxy = True
+        self.proxy = None
 
     def open_file(self, file_path):
         """
@@ -18,20 +74,47 @@ class VideoCap(cv2.VideoCapture):
         ok = self.open(file_path, apiPreference=cv2.CAP_ANY, params=[cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
         if ok is False:
             print(f"Failed to open {file_path}")
-        frame_count = int(self.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.set(cv2.CAP_PROP_POS_FRAMES, frame_count - 1)
-        ret, _ = self.read()
-        if ret is False:
-            print("Failed to read last frame.")
-        self.max_msec = self.get(cv2.CAP_PROP_POS_MSEC)
-
-    def read_at(self, msec, scale=None, rgb=False, read_anyway=True):
+        self.file_path = file_path
+        self.frame_cache.clear()
+        # 最終フレームのmsecを測るのは遅いので、前に開いたときのメタデータがあれば使う
+        self.meta = video_meta.get_cache().get(file_path)
+        if self.meta is None:
+            self.meta = video_meta.probe(self)
+            if ok is True:
+                video_meta.get_cache().put(file_path, self.meta)
+        self.max_msec = self.meta["max_msec"]
+        # 全フレームの時刻とキーフレームの索引、順に読むだけなら要らないので開いたときには作らない
+        self.video_index = None
+        self.is_index_pending = ok
+        if self.proxy is not None:
+            self.proxy.release()
+        self.proxy = video_proxy.open_proxy(file_path) if self.use_proxy is True and ok is True else None
+
+    def read_at(self, msec, scale=None, rgb=False, read_anyway=True, use_cache=True):
         """
         ミリ秒を指定してreadする
+        use_cache: Trueなら同じmsec, scale, rgbで読んだフレームをキャッシュから返す
+            呼び出し側で描き込んでもキャッシュが変わらないようにコピーを返す
+        proxyから読むときは、scaleを指定すれば元の動画をscale倍した大きさに、scale=Noneならproxyの大きさのまま返す
+            元の大きさに拡大しても細かくはならないので、元の動画の座標はframe.shapeとget_frame_size()の比で合わせる
         """
-        self.set_frame_pos(msec)
-        ok, frame = self.read()
-        msec = self.get(cv2.CAP_PROP_POS_MSEC)
+        key = (msec, scale, rgb)
+        if use_cache is True:
+            cached = self.frame_cache.get(key)
+            if cached is not None:
+                frame, self.read_msec = cached
+                return True, frame.copy()
+
+        if self.proxy is not None:
+            ok, frame = self._read_proxy(msec)
+        else:
+            ok = self._grab_at(msec)
+            frame = None
+            if ok is True:
+                ok, frame = self.retrieve()
+            self.read_msec = self.get(cv2.CAP_PROP_POS_MSEC)
+        # read_anywayで黒画像を返したときはキャッシュしない
+        self.decoded = ok
         if ok is False:
             if read_anyway is False:
                 return ok, frame
@@ -40,8 +123,16 @@ class VideoCap(cv2.VideoCapture):
                 frame = self.dummy_frame
         if rgb is True:
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        if scale is not None:
+        if self.proxy is not None and self.decoded is True:
+            # scaleを指定されたら、元の動画から読んでscale倍したときと同じ大きさにする
+            if scale is not None:
+                width, height = self.meta["frame_size"]
+                frame = cv2.resize(frame, (round(width * scale), round(height * scale)))
+        elif scale is not None:
             frame = cv2.resize(frame, None, fx=scale, fy=scale)
+        if use_cache is True and self.decoded is True:
+            self.frame_cache.put(key, frame, self.read_msec)
+            frame = frame.copy()
         return ok, frame
 
     def read_anyway(self):
@@ -54,7 +145,111 @@ class VideoCap(cv2.VideoCapture):
         return frame
 
     def set_frame_pos(self, msec):
-        self.set(cv2.CAP_PROP_POS_MSEC, msec)
+        """
+        msecのフレームを次にreadできるようにする
+        """
+        if self._get_index() is None:
+            self.set(cv2.CAP_PROP_POS_MSEC, msec)
+            return
+        self.set_frame_num(self.video_index.frame_num(msec))
+
+    def set_frame_num(self, frame_num):
+        """
+        frame_num番目のフレームを次にreadできるようにする
+        track fileのframeは検出時にread()した順の番号なので、msecを経由せずにそのフレームへ移れる
+        """
+        if self._get_index() is None or frame_num >= len(self.video_index):
+            self.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+        elif frame_num == 0:
+            self.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        else:
+            self._grab_indexed(frame_num - 1)
+
+    def _read_proxy(self, msec):
+        """
+        msecのフレームをproxyから読む、元の動画とproxyはフレームの番号が同じ
+        """
+        if self._get_index() is not None:
+            frame_num = self.video_index.frame_num(msec)
+            self.read_msec = self.video_index.frame_msec[frame_num]
+        else:
+            fps = self.meta["fps"]
+            frame_num = int(msec * fps / 1000 + 0.5) if fps > 0 else 0
+            self.read_msec = frame_num * 1000 / fps if fps > 0 else 0
+        # MJPGはどのフレームにもそのままseekできる
+        if frame_num != int(self.proxy.get(cv2.CAP_PROP_POS_FRAMES)):
+            self.proxy.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+        return self.proxy.read()
+
+    def _grab_at(self, msec):
+        """
+        msecのフレームをgrab()した状態にする、retrieve()で取り出せる
+        """
+        if self._get_index() is None:
+            self._seek(msec)
+            return self.grab()
+        return self._grab_indexed(self.video_index.frame_num(msec))
+
+    def _get_index(self):
+        """
+        seekするときに呼ぶ、まだなら索引を読み込むか作る、作れなければNone
+        """
+        if self.is_index_pending is True:
+            self.is_index_pending = False
+            self.video_index = video_index.load_or_build(self.file_path)
+        return self.video_index
+
+    def _grab_indexed(self, frame_num):
+        """
+        索引を使ってframe_num番目のフレームをgrab()した状態にする
+        今の位置から少し先ならそのままgrab()で進み、そうでなければseekしてから進む
+        フレームの時刻で確かめながら進むので、seekの着地点が手前にずれていても目的のフレームで止まる
+        """
+        tar_msec = self.video_index.frame_msec[frame_num]
+        cur_msec = self.get(cv2.CAP_PROP_POS_MSEC)
+        cur_num = self.video_index.frame_num(cur_msec)
+        is_on_index = abs(self.video_index.frame_msec[cur_num] - cur_msec) < 0.5
+        if is_on_index is False or cur_num >= frame_num or tar_msec - cur_msec > self.grab_window_msec:
+            # まずは目的の時刻にseekする、固定フレームレートならそのまま目的のフレームに着地する
+            # 可変フレームレートでは後ろに着地することがあるので、そのときは手前のキーフレームから順に試す
+            seek_msec_list = [tar_msec] + [self.video_index.frame_msec[n] for n in self.video_index.keyframes_before(frame_num)]
+            for seek_msec in seek_msec_list:
+                self.set(cv2.CAP_PROP_POS_MSEC, seek_msec)
+                if self.grab() is False:
+                    continue
+                if self.get(cv2.CAP_PROP_POS_MSEC) <= tar_msec + 0.5:
+                    break
+            else:
+                self.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                if self.grab() is False:
+                    return False
+        else:
+            if self.grab() is False:
+                return False
+        while self.get(cv2.CAP_PROP_POS_MSEC) < tar_msec - 0.5:
+            if self.grab() is False:
+                return False
+        return True
+
+    def _seek(self, msec):
+        """
+        msecのフレームを次にreadできるようにする
+        set(CAP_PROP_POS_MSEC)は近くても手前のキーフレームまで戻ってデコードし直すので、
+        少し先に進むだけならgrab()で読み飛ばす、読み飛ばしたフレームは色変換しないぶん速い
+        """
+        fps = self.meta["fps"] if self.meta is not None else 0
+        if fps <= 0:
+            self.set_frame_pos(msec)
+            return
+        # set(CAP_PROP_POS_MSEC)と同じように四捨五入でフレーム番号にする
+        tar_frame_num = int(msec * fps / 1000 + 0.5)
+        skip_num = tar_frame_num - int(self.get(cv2.CAP_PROP_POS_FRAMES))
+        if skip_num < 0 or skip_num > self.grab_window_msec * fps / 1000:
+            self.set_frame_pos(msec)
+            return
+        for _ in range(skip_num):
+            if self.grab() is False:
+                break
 
     def get_frame_size(self):
         return self.frame_size
@@ -69,29 +264,56 @@ class VideoCap(cv2.VideoCapture):
     def get_max_msec(self):
         return self.max_msec
 
+    def get_read_msec(self):
+        return self.read_msec
+
+    def get_cache_stats(self):
+        return self.frame_cache.get_stats()
+
 
 class MultiVcap:
     """
     分割されたmp4に対して、通しのmsecでread_atするためのクラス
+    分割をまたいで行き来するたびに開き直さないように、開いたVideoCapを最大max_open個までLRUで持っておく
     """
 
-    def __init__(self, vcap):
+    def __init__(self, vcap, max_open=4):
+        # vcapは今読んでいる分割のVideoCap、最初は渡されたものを使い、他の分割用にはこれと同じ設定のVideoCapを作る
         self.vcap = vcap
+        self.max_open = max(1, max_open)
+        self.captures = OrderedDict()
+        # open_files()で閉じたVideoCap、捨てずに次に開くときに使う
+        self.spare_captures = []
         self.file_path_list = []
         self.current_file_idx = 0
+        # 通しのmsecで持つので、分割をまたいで行き来してもファイルを開き直さずに済む
+        self.frame_cache = FrameCache()
+        self.read_msec = 0
 
     def open_files(self, file_path_list):
+        self._release_captures()
         total_msec_list = []
+        total_frame_list = []
         total_msec = 0
+        total_frame = 0
         for file_path in file_path_list:
-            self.vcap.open_file(file_path)
-            total_msec += self.vcap.get_max_msec()
+            # メタデータのキャッシュがあれば開かずに長さがわかる
+            meta = video_meta.get_cache().get(file_path)
+            if meta is None:
+                self.vcap.open_file(file_path)
+                meta = self.vcap.meta
+            total_msec += meta["max_msec"]
             total_msec_list.append(total_msec)
+            total_frame += meta["frame_count"]
+            total_frame_list.append(total_frame)
 
-        # file_path_listとtotal_msec_listは先頭が最初の動画になっていること
+        # file_path_listとtotal_msec_list, total_frame_listは先頭が最初の動画になっていること
         self.total_msec_list = np.array(total_msec_list)
+        self.total_frame_list = np.array(total_frame_list)
         self.file_path_list = file_path_list
+        self.frame_cache.clear()
         self.vcap.open_file(self.file_path_list[0])
+        self.captures[0] = self.vcap
         self.current_file_idx = 0
         self.isOpened = self.vcap.isOpened
 
@@ -99,38 +321,230 @@ class MultiVcap:
         tar_idx, msec = self._search_file_idx_and_msec(msec)
         self.vcap.set_frame_pos(msec)
 
-    def read_at(self, msec, scale=None, rgb=False, read_anyway=True):
-        tar_idx, msec = self._search_file_idx_and_msec(msec)
-        ok, frame = self.vcap.read_at(msec, scale=scale, rgb=rgb, read_anyway=read_anyway)
+    def set_frame_num(self, frame_num):
+        """
+        通しのframe_num番目のフレームを次にreadできるようにする
+        """
+        tar_idx = np.searchsorted(self.total_frame_list, frame_num, side="right")
+        if tar_idx >= len(self.total_frame_list):
+            return
+        if tar_idx != self.current_file_idx:
+            self._switch(tar_idx)
+        if tar_idx > 0:
+            frame_num -= self.total_frame_list[tar_idx - 1]
+        self.vcap.set_frame_num(int(frame_num))
+
+    def read_at(self, msec, scale=None, rgb=False, read_anyway=True, use_cache=True):
+        key = (msec, scale, rgb)
+        if use_cache is True:
+            cached = self.frame_cache.get(key)
+            if cached is not None:
+                frame, self.read_msec = cached
+                return True, frame.copy()
+
+        tar_idx, part_msec = self._search_file_idx_and_msec(msec)
+        ok, frame = self.vcap.read_at(part_msec, scale=scale, rgb=rgb, read_anyway=read_anyway, use_cache=False)
+        self.read_msec = msec - part_msec + self.vcap.get_read_msec()
+        if use_cache is True and self.vcap.decoded is True:
+            self.frame_cache.put(key, frame, self.read_msec)
+            frame = frame.copy()
         return ok, frame
 
+    def read_anyway(self):
+        """
+        続けてreadする、今の分割の最後まで読んだら次の分割の先頭から読む
+        全ての分割を読み終えたら黒画像を返す
+        """
+        ok, frame = self.vcap.read()
+        while ok is False and self.current_file_idx + 1 < len(self.file_path_list):
+            self._switch(self.current_file_idx + 1)
+            self.vcap.set_frame_num(0)
+            ok, frame = self.vcap.read()
+        if ok is False:
+            frame = self.vcap.dummy_frame
+        return frame
+
     def get(self, prop_id):
         return self.vcap.get(prop_id)
 
     def set_frame_size(self, frame_size):
+        for cap in self.captures.values():
+            cap.set_frame_size(frame_size)
         self.vcap.set_frame_size(frame_size)
 
     def get_frame_size(self):
         return self.vcap.get_frame_size()
 
+    def get_max_msec(self):
+        return self.total_msec_list[-1]
+
+    def get_read_msec(self):
+        return self.read_msec
+
+    def get_cache_stats(self):
+        return self.frame_cache.get_stats()
+
+    def release(self):
+        self._release_captures()
+        self.vcap.release()
+
     def clear(self):
         self.file_path_list = []
         self.current_file_idx = 0
+        self.frame_cache.clear()
 
     def _search_file_idx_and_msec(self, msec):
         tar_idx = np.searchsorted(self.total_msec_list, msec, side="left")
         if tar_idx >= len(self.total_msec_list):
             return None, None
         if tar_idx != self.current_file_idx:
-            tar_path = self.file_path_list[tar_idx]
-            self.vcap.open_file(tar_path)
-            self.current_file_idx = tar_idx
+            self._switch(tar_idx)
         if tar_idx == 0:
             ret_msec = msec
         else:
             ret_msec = msec - self.total_msec_list[tar_idx - 1]
         return tar_idx, ret_msec
 
+    def _switch(self, tar_idx):
+        """
+        tar_idx番目の分割のVideoCapに切り替える、開いていなければ開く
+        max_open個開いていたら、一番使っていないVideoCapで開き直す
+        """
+        if tar_idx in self.captures:
+            self.captures.move_to_end(tar_idx)
+        else:
+            if len(self.captures) >= self.max_open:
+                # VideoCapを作っては捨てるとsegfaultの原因になるため使い回す
+                _, cap = self.captures.popitem(last=False)
+            elif len(self.spare_captures) > 0:
+                cap = self.spare_captures.pop()
+                cap.use_proxy = self.vcap.use_proxy
+            else:
+                cap = VideoCap()
+                cap.use_proxy = self.vcap.use_proxy
+                cap.grab_window_msec = self.vcap.grab_window_msec
+                cap.set_frame_size(self.vcap.get_frame_size())
+            cap.open_file(self.file_path_list[tar_idx])
+            self.captures[tar_idx] = cap
+        self.vcap = self.captures[tar_idx]
+        self.current_file_idx = tar_idx
+        self.isOpened = self.vcap.isOpened
+
+    def _release_captures(self):
+        for cap in self.captures.values():
+            if cap is not self.vcap:
+                cap.release()
+                self.spare_captures.append(cap)
+        self.captures.clear()
+
+
+class FramePrefetcher:
+    """
+    GUI用、今の位置の前後のフレームを別のスレッドで読んでおき、スライダーを動かしたときにseekとdecodeを待たずに表示する
+    GUIのcapを別のスレッドから触らないように、同じ動画を開いた自分用のcapで読む
+    VideoCapを作っては捨てるとsegfaultの原因になるため、1つを使い回してtrack fileを読み込むたびにopen()で開き直す
+    request()で新しい位置を指定すると、まだ読んでいない古い位置の先読みは捨てる
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.vcap = VideoCap()
+        # 分割された動画用、初めて必要になったときにself.vcapを使って作る
+        self.multi_cap = None
+        self.cap = None
+        self.frame_cache = FrameCache(max_bytes)
+        # 読めなかったフレーム、GUIが待ち続けないように
+        self.failed_keys = set()
+        self.requests = []
+        self.scale = None
+        self.is_stopped = False
+        # open()するたびに増やし、開き直す前に読み始めたフレームを捨てる
+        self.generation = 0
+        self.cond = threading.Condition()
+        # self.capを読んでいる間はopen()で開き直さない
+        self.read_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def open(self, cap):
+        """
+        cap(VideoCapかMultiVcap)と同じ動画を開き直す、先読みしたフレームと読めなかったフレームは捨てる
+        """
+        with self.cond:
+            self.requests = []
+            self.frame_cache.clear()
+            self.failed_keys.clear()
+            self.generation += 1
+        with self.read_lock:
+            if isinstance(cap, MultiVcap):
+                if self.multi_cap is None:
+                    self.multi_cap = MultiVcap(self.vcap, max_open=cap.max_open)
+                self.multi_cap.vcap.use_proxy = cap.vcap.use_proxy
+                self.multi_cap.open_files(cap.file_path_list)
+                self.cap = self.multi_cap
+            else:
+                self.vcap.use_proxy = cap.use_proxy
+                self.vcap.open_file(cap.file_path)
+                self.cap = self.vcap
+            self.cap.set_frame_size(cap.get_frame_size())
+
+    def request(self, msec_list, scale):
+        """
+        msec_listの先頭から順に読む、前のrequest()で読み残したものは捨てる
+        前に読めなかったフレームも、もう一度読んでみる
+        """
+        with self.cond:
+            self.requests = list(msec_list)
+            self.scale = scale
+            self.failed_keys.clear()
+            self.cond.notify()
+
+    def get(self, msec, scale):
+        """
+        読み終わっていればRGBのフレーム(コピー)を返す、まだならNone
+        """
+        with self.cond:
+            cached = self.frame_cache.get((msec, scale))
+        if cached is None:
+            return None
+        return cached[0].copy()
+
+    def is_failed(self, msec, scale):
+        with self.cond:
+            return (msec, scale) in self.failed_keys
+
+    def stop(self):
+        with self.cond:
+            self.is_stopped = True
+            self.cond.notify()
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                while len(self.requests) == 0 and self.is_stopped is False:
+                    self.cond.wait()
+                if self.is_stopped is True:
+                    break
+                msec = self.requests.pop(0)
+                key = (msec, self.scale)
+                generation = self.generation
+                if key in self.frame_cache.items or key in self.failed_keys:
+                    continue
+            with self.read_lock:
+                if self.cap is None or generation != self.generation:
+                    continue
+                ok, frame = self.cap.read_at(msec, scale=key[1], rgb=True, read_anyway=False, use_cache=False)
+            with self.cond:
+                if generation != self.generation:
+                    continue
+                if ok is True:
+                    self.frame_cache.put(key, frame, msec)
+                else:
+                    self.failed_keys.add(key)
+        with self.read_lock:
+            if self.multi_cap is not None:
+                self.multi_cap.release()
+            self.vcap.release()
+
 
 class RoiCap(cv2.VideoCapture):
     def __init__(self):
@@ -218,6 +632,42 @@ class RoiCap(cv2.VideoCapture):
         self.set_frame_pos(0)
         self.set_roi(self.left_top_point, self.right_bottom_point)
 
+    def auto_roi(self, detect_boxes, sample_num=30, padding=0.2):
+        """
+        動画全体から等間隔にsample_numフレームを取り出してdetect_boxes(frame)で人物を検出し、
+        全てのbboxを囲む矩形をbboxの大きさのpadding倍だけ広げてROIにする
+        detect_boxes(frame) -> (N, 4: left, top, right, bottom)のbbox
+        人物が1人も見つからなければROIは画面全体のままにしてFalseを返す
+        """
+        self.set_roi((0, 0), (self.width, self.height))
+        total_frame_num = int(self.get(cv2.CAP_PROP_FRAME_COUNT))
+        boxes = []
+        for frame_num in np.linspace(0, max(total_frame_num - 1, 0), sample_num, dtype=int):
+            self.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+            ret, frame = self.read()
+            if ret is False:
+                continue
+            frame_boxes = np.asarray(detect_boxes(frame), dtype=np.float64)
+            if len(frame_boxes) > 0:
+                boxes.append(frame_boxes[:, :4])
+        self.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        if len(boxes) == 0:
+            print("Auto ROI: no person found, use the whole frame.")
+            return False
+
+        boxes = np.concatenate(boxes, axis=0)
+        # 人の大きさに合わせて広げる、サンプルしなかったフレームでの動きの分の余白
+        pad_x = (boxes[:, 2] - boxes[:, 0]).max() * padding
+        pad_y = (boxes[:, 3] - boxes[:, 1]).max() * padding
+        left = int(max(0, boxes[:, 0].min() - pad_x))
+        top = int(max(0, boxes[:, 1].min() - pad_y))
+        right = int(min(self.width, np.ceil(boxes[:, 2].max() + pad_x)))
+        bottom = int(min(self.height, np.ceil(boxes[:, 3].max() + pad_y)))
+        self.set_roi((left, top), (right, bottom))
+        area_ratio = self.roi_width * self.roi_height / (self.width * self.height)
+        print(f"Auto ROI: {(left, top)}-{(right, bottom)} ({area_ratio:.0%} of the frame, {len(boxes)} boxes)")
+        return True
+
     def mouse_callback(self, event, x, y, flags, param):
         if event == cv2.EVENT_LBUTTONDOWN:
             self.left_top_point = (x, y)
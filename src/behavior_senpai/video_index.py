@@ -0,0 +1,131 @@
+import hashlib
+import os
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+
+class VideoIndex:
+    """
+    動画の全フレームの表示時刻(msec)とキーフレームの位置、アプリのフォルダのvideo_index/に保存して使い回す
+    CAP_PROP_POS_MSECでのseekは平均fpsでフレーム番号に換算するので、可変フレームレートの動画では数秒ずれることがある
+    直前のキーフレームから目的の時刻のフレームまでデコードして進めば、ずれずに読める
+    """
+
+    def __init__(self, frame_msec, keyframe_nums):
+        # frame_msecは表示順にソート済み
+        self.frame_msec = np.asarray(frame_msec, dtype=np.float64)
+        self.keyframe_nums = np.asarray(keyframe_nums, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.frame_msec)
+
+    def frame_num(self, msec):
+        """
+        msecに一番近いフレームの番号
+        """
+        idx = int(np.searchsorted(self.frame_msec, msec, side="left"))
+        if idx >= len(self.frame_msec):
+            return len(self.frame_msec) - 1
+        if idx > 0 and msec - self.frame_msec[idx - 1] < self.frame_msec[idx] - msec:
+            return idx - 1
+        return idx
+
+    def keyframes_before(self, frame_num):
+        """
+        frame_num以前のキーフレームの番号を近い順に返す
+        """
+        idx = np.searchsorted(self.keyframe_nums, frame_num, side="right")
+        return self.keyframe_nums[:idx][::-1]
+
+
+# プロセス内で読み込んだ索引、同じ動画を開いた複数のVideoCapで作り直さない
+_loaded = {}
+_lock = threading.Lock()
+
+
+def load_or_build(video_path):
+    """
+    動画と同じサイズ、更新日時で作った索引があれば読み込み、なければ作って保存する
+    作れなかったらNoneを返す
+    別のスレッドのVideoCapが同じ動画の索引を作っている間は、作り終わるのを待ってそれを使う
+    """
+    stat = os.stat(video_path)
+    video_stat = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    key = os.path.normcase(os.path.abspath(video_path))
+    with _lock:
+        loaded = _loaded.get(key)
+        if loaded is not None and np.array_equal(loaded[0], video_stat) is True:
+            return loaded[1]
+        video_index = _load_or_build(video_path, video_stat)
+        _loaded[key] = (video_stat, video_index)
+    return video_index
+
+
+def _load_or_build(video_path, video_stat):
+    index_path = _index_path(video_path)
+    if os.path.exists(index_path) is True:
+        try:
+            with np.load(index_path) as npz:
+                if np.array_equal(npz["video_stat"], video_stat) is True:
+                    return VideoIndex(npz["frame_msec"], npz["keyframe_nums"])
+        except (OSError, KeyError, ValueError):
+            print(f"Broken video index: {index_path}")
+
+    video_index = build(video_path)
+    if video_index is None:
+        return None
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        np.savez(index_path, video_stat=video_stat, frame_msec=video_index.frame_msec, keyframe_nums=video_index.keyframe_nums)
+    except OSError as e:
+        # 保存できなくても、開いている間は索引を使う
+        print(f"Failed to save video index: {e}")
+    return video_index
+
+
+def _index_path(video_path):
+    """
+    動画のフォルダを汚さないように、アプリのフォルダのvideo_index/に動画の名前とpathのhashで保存する
+    """
+    key = os.path.normcase(os.path.abspath(video_path))
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    path_hash = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(_find_data_dir(), "video_index", f"{name}_{path_hash}.npz")
+
+
+def build(video_path):
+    """
+    デコードせずにパケットだけを順に読んで、表示時刻とキーフレームかどうかを集める
+    パケットはデコード順なので、表示時刻でソートしてからキーフレームの番号を決める
+    """
+    print(f"Indexing {video_path}")
+    cap = cv2.VideoCapture()
+    ok = cap.open(video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+    if ok is False:
+        return None
+    packet_msec = []
+    is_keyframe = []
+    while cap.grab() is True:
+        packet_msec.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+        is_keyframe.append(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) > 0)
+    cap.release()
+    if len(packet_msec) == 0 or any(is_keyframe) is False:
+        return None
+
+    packet_msec = np.array(packet_msec, dtype=np.float64)
+    order = np.argsort(packet_msec, kind="stable")
+    frame_msec = packet_msec[order]
+    keyframe_nums = np.flatnonzero(np.array(is_keyframe)[order])
+    return VideoIndex(frame_msec, keyframe_nums)
+
+
+def _find_data_dir():
+    if getattr(sys, "frozen", False):
+        # frozen
+        return os.path.dirname(sys.executable)
+    else:
+        # unfrozen
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
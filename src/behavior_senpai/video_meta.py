@@ -0,0 +1,123 @@
+import os
+import pickle
+import sys
+
+import cv2
+
+
+class VideoMetaCache:
+    """
+    動画ファイルのメタデータ(フレーム数、fps、長さ、フレームの大きさ、最終フレームのmsec)をファイルに保存して使い回す
+    最終フレームのmsecは最後までseekしてreadしないとわからず、長いH.264では1回に数秒かかるため
+    pathとファイルサイズ、更新日時が一致したときだけ使うので、動画が上書きされたら測り直す
+    """
+
+    file_name = "video_meta.pkl"
+
+    def __init__(self, file_path=None, max_entries=1000):
+        if file_path is None:
+            file_path = os.path.join(_find_data_dir(), self.file_name)
+        self.file_path = file_path
+        self.max_entries = max_entries
+        self.data = {}
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.file_path) is False:
+            return
+        try:
+            with open(self.file_path, "rb") as f:
+                self.data = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            print(f"Broken video meta cache: {self.file_path}")
+            self.data = {}
+
+    def save(self):
+        # 別のプロセスが読んでいる途中でも壊れないように、書き終えてから置き換える
+        tmp_path = f"{self.file_path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(self.data, f)
+            os.replace(tmp_path, self.file_path)
+        except OSError as e:
+            print(f"Failed to save video meta cache: {e}")
+
+    def get(self, video_path):
+        """
+        キャッシュがあり、動画が変わっていなければメタデータのdictを返す、なければNone
+        """
+        key = _to_key(video_path)
+        if key not in self.data:
+            return None
+        entry = self.data[key]
+        stat = _file_stat(video_path)
+        if stat is None or entry["stat"] != stat:
+            return None
+        return entry["meta"]
+
+    def put(self, video_path, meta):
+        stat = _file_stat(video_path)
+        if stat is None:
+            return
+        # 他のプロセスが足したものを消さないように読み直してから足す
+        self.load()
+        key = _to_key(video_path)
+        self.data.pop(key, None)
+        self.data[key] = {"stat": stat, "meta": meta}
+        # 溜まり続けないように、古いものから捨てる
+        while len(self.data) > self.max_entries:
+            self.data.pop(next(iter(self.data)))
+        self.save()
+
+
+def probe(cap):
+    """
+    開いたcv2.VideoCaptureからメタデータを測る、最終フレームまでseekするので遅い
+    """
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count - 1)
+    ret, _ = cap.read()
+    if ret is False:
+        print("Failed to read last frame.")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    return {
+        "frame_count": frame_count,
+        "fps": fps,
+        "duration_msec": frame_count / fps * 1000 if fps > 0 else 0,
+        "frame_size": (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))),
+        "max_msec": cap.get(cv2.CAP_PROP_POS_MSEC),
+    }
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    プロセス内で共有するVideoMetaCache
+    """
+    global _cache
+    if _cache is None:
+        _cache = VideoMetaCache()
+    return _cache
+
+
+def _to_key(video_path):
+    return os.path.normcase(os.path.abspath(video_path))
+
+
+def _file_stat(video_path):
+    try:
+        stat = os.stat(video_path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _find_data_dir():
+    if getattr(sys, "frozen", False):
+        # frozen
+        return os.path.dirname(sys.executable)
+    else:
+        # unfrozen
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
@@ -0,0 +1,75 @@
+import os
+
+import cv2
+
+
+def proxy_path(video_path):
+    """
+    動画と同じフォルダのproxy/xxx.avi
+    """
+    video_dir, file_name = os.path.split(video_path)
+    return os.path.join(video_dir, "proxy", f"{os.path.splitext(file_name)[0]}.avi")
+
+
+def make_proxy(video_path, long_side=960, progress=None):
+    """
+    GUIで表示するための小さな動画(proxy)を作る、検出や書き出しには使わない
+    MJPGは全てのフレームがキーフレームなので、どこへseekしても前のフレームからデコードし直さずに済む
+    元の動画のi番目のフレームがproxyのi番目のフレームになる
+    progress(frame_num, total_frame_num): 1フレーム書き出すたびに呼ばれる
+    """
+    cap = cv2.VideoCapture(video_path)
+    if cap.isOpened() is False:
+        print(f"Failed to open {video_path}")
+        return None
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frame_num = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    ratio = min(1.0, long_side / max(width, height))
+    size = (max(2, round(width * ratio / 2) * 2), max(2, round(height * ratio / 2) * 2))
+
+    dst_path = proxy_path(video_path)
+    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+    # 途中で止まった不完全なproxyを使わないように、書き終えてから置き換える
+    tmp_path = f"{os.path.splitext(dst_path)[0]}.tmp.avi"
+    writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    if writer.isOpened() is False:
+        # MJPGで書き出せない環境では、全フレームをデコードする前にやめる
+        print(f"Failed to open a MJPG writer: {tmp_path}")
+        cap.release()
+        return None
+    frame_num = 0
+    while True:
+        ok, frame = cap.read()
+        if ok is False:
+            break
+        writer.write(cv2.resize(frame, size, interpolation=cv2.INTER_AREA))
+        if progress is not None:
+            progress(frame_num, total_frame_num)
+        frame_num += 1
+    writer.release()
+    cap.release()
+    if frame_num == 0:
+        if os.path.exists(tmp_path) is True:
+            os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, dst_path)
+    print(f"Proxy: {dst_path} ({size[0]}x{size[1]}, {frame_num} frames)")
+    return dst_path
+
+
+def open_proxy(video_path):
+    """
+    元の動画より新しいproxyがあれば開いたcv2.VideoCaptureを返す、なければNone
+    """
+    tar_path = proxy_path(video_path)
+    if os.path.exists(tar_path) is False:
+        return None
+    if os.path.getmtime(tar_path) < os.path.getmtime(video_path):
+        print(f"Proxy is older than the video, ignored: {tar_path}")
+        return None
+    cap = cv2.VideoCapture(tar_path)
+    if cap.isOpened() is False:
+        return None
+    return cap
@@ -1,80 +1,62 @@
 import cv2
-import pandas as pd
 from ultralytics import YOLO
 
-from behavior_senpai import img_draw, pose_drawer, vcap
+from behavior_senpai import detector_base, pose_drawer
 
 
-class YoloDetector:
-    def __init__(self, show=True, model="YOLO11 x-pose"):
+class YoloDetector(detector_base.DetectorBase):
+    columns = ["x", "y", "conf"]
+
+    def __init__(self, show=True, model="YOLO11 x-pose", batch_size=1):
+        super().__init__(show=show, batch_size=batch_size)
         if model == "YOLO11 x-pose":
             model = "yolo11x-pose"
         elif model == "YOLOv8 x-pose-p6":
             model = "yolov8x-pose-p6"
-        self.model = YOLO(model=f"{model}.pt")
+        self.model_path = f"{model}.pt"
+        self.model = YOLO(model=self.model_path)
+        # auto_roi()用、track()のtracker(callback)が付いていない別のYOLO、使うときに読み込む
+        self.box_model = None
 
         self.number_of_keypoints = 17
-        self.show = show
-
-    def set_cap(self, cap):
-        self.cap = cap
-        self.total_frame_num = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-    def detect(self, roi=False):
-        # データの初期化
-        data_dict = {"frame": [], "member": [], "keypoint": [], "x": [], "y": [], "conf": [], "timestamp": []}
-        for i in range(self.total_frame_num):
-            if roi is True:
-                ret, frame = self.cap.get_roi_frame()
-            else:
-                ret, frame = self.cap.read()
-            if ret is False:
-                print("Failed to read frame.")
-                continue
-
-            result = self.model.track(frame, verbose=False, persist=True, classes=0)
-            timestamp = self.cap.get(cv2.CAP_PROP_POS_MSEC)
-
-            # 検出結果を描画、xキーで途中終了
-            if self.show is True:
-                frame = pose_drawer.yolo_draw(frame, result)
-                _, frame = vcap.resize_frame(frame)
-                img_draw.put_frame_pos(frame, i, self.total_frame_num)
-                img_draw.put_message(frame, "'x' key to exit.", font_size=1.5, y=55)
-                cv2.imshow("dst", frame)
-                key = cv2.waitKey(1) & 0xFF
-                if key == ord("x"):
-                    break
-
-            # 検出結果の取り出し
-            result_keypoints = result[0].keypoints.data
-            result_boxes = result[0].boxes.data
-            for keypoints, boxes in zip(result_keypoints, result_boxes, strict=False):
-                member_id = int(boxes[4])
-                for k in range(self.number_of_keypoints):
-                    keypoint_id = k
-                    x = float(keypoints[k][0])
-                    y = float(keypoints[k][1])
-                    if roi is True:
-                        x += self.cap.left_top_point[0]
-                        y += self.cap.left_top_point[1]
-                    conf = float(keypoints[k][2])
-
-                    # データの詰め込み
-                    data_dict["frame"].append(i)
-                    data_dict["member"].append(member_id)
-                    data_dict["keypoint"].append(keypoint_id)
-                    data_dict["x"].append(x)
-                    data_dict["y"].append(y)
-                    data_dict["conf"].append(conf)
-                    data_dict["timestamp"].append(timestamp)
-
-        # memberとkeypointはここではintで保持する、indexでソートしたくなるかもしれないので
-        self.dst_df = pd.DataFrame(data_dict).set_index(["frame", "member", "keypoint"])
-        cv2.destroyAllWindows()
 
-    def get_result(self):
-        return self.dst_df
+    def reset(self):
+        """
+        別の動画を検出する前に呼ぶ、persist=Trueで引き継がれるtrackerの状態とIDを初期化する
+        trackersを消すとtrack()でcallbackが重複して登録されるので、trackerごとにreset()する
+        """
+        predictor = self.model.predictor
+        if predictor is not None and hasattr(predictor, "trackers"):
+            for tracker in predictor.trackers:
+                tracker.reset()
+
+    def detect_person_boxes(self, frame):
+        """
+        RoiCap.auto_roi()用、frameの人物のbbox(N, 4: left, top, right, bottom)を返す
+        track()したself.modelでpredict()すると、残っているtrackerのcallbackでサンプルのフレームがtrackerに入るので別のYOLOを使う
+        """
+        if self.box_model is None:
+            self.box_model = YOLO(model=self.model_path)
+        result = self.box_model.predict(frame, verbose=False, classes=0)[0]
+        return result.boxes.xyxy.cpu().numpy()
+
+    def infer_batch(self, frames):
+        """
+        複数フレームを1回のtrack()で推論する
+        trackerはバッチ内のフレームを先頭から順に更新するので、member_idは1フレームずつ処理した場合と同じになる
+        """
+        return self.model.track(frames, verbose=False, persist=True, classes=0)
+
+    def draw(self, frame, result):
+        return pose_drawer.yolo_draw(frame, [result])
+
+    def to_keypoints(self, result):
+        # 検出結果の取り出し
+        if result.keypoints is None or len(result.boxes) == 0:
+            return []
+        keypoints = result.keypoints.data.cpu().numpy()
+        member_ids = result.boxes.data[:, 4].cpu().numpy().astype(int)
+        return [(member_ids, keypoints)]
 
 
 def detect_from_picture(src_path):
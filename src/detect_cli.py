@@ -0,0 +1,185 @@
+"""
+Headless keypoint detection.
+Runs detector_proc.exec() without any window and prints progress as JSON lines to stdout.
+Other messages are written to stderr.
+
+Run from the repository root (the same directory as launcher), e.g.
+    python src/detect_cli.py "D:/videos/*.mp4" --engine "MediaPipe Holistic" --suffix
+"""
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+
+import detector_proc
+from behavior_senpai import vcap
+
+
+class ProgressPrinter:
+    """Print progress of one video as JSON lines at most once per interval."""
+
+    def __init__(self, out, video_path, file_idx, file_num, interval_sec=1.0):
+        self.out = out
+        self.video_path = video_path
+        self.file_idx = file_idx
+        self.file_num = file_num
+        self.interval_sec = interval_sec
+        self.start_time = time.perf_counter()
+        # モデルの読み込み時間を含めないように最初のフレームから計測する
+        self.first_time = None
+        self.first_frame_num = 0
+        self.last_time = 0
+
+    def __call__(self, frame_num, total_frame_num):
+        now = time.perf_counter()
+        if self.first_time is None:
+            self.first_time = now
+            self.first_frame_num = frame_num
+        is_last = frame_num >= total_frame_num - 1
+        if now - self.last_time < self.interval_sec and is_last is False:
+            return
+        self.last_time = now
+        elapsed_sec = now - self.first_time
+        done_num = frame_num + 1
+        fps = (frame_num - self.first_frame_num) / elapsed_sec if elapsed_sec > 0 else 0.0
+        eta_sec = (total_frame_num - done_num) / fps if fps > 0 else None
+        emit(
+            self.out,
+            "progress",
+            file=self.video_path,
+            file_idx=self.file_idx,
+            file_num=self.file_num,
+            frame=done_num,
+            total_frames=total_frame_num,
+            fps=round(fps, 2),
+            eta_sec=None if eta_sec is None else round(eta_sec, 1),
+        )
+
+
+def emit(out, event, **kwargs):
+    line = {"event": event, "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())}
+    line.update(kwargs)
+    out.write(json.dumps(line, ensure_ascii=False) + "\n")
+    out.flush()
+
+
+def expand_paths(patterns):
+    """Expand globs and keep the order of the arguments without duplicates."""
+    video_paths = []
+    for pattern in patterns:
+        matched = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matched:
+            if os.path.isfile(path) and path not in video_paths:
+                video_paths.append(path)
+    return video_paths
+
+
+def parse_roi(roi_str):
+    """Parse "left,top,right,bottom" into ((left, top), (right, bottom))."""
+    values = [int(v) for v in roi_str.split(",")]
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError("ROI must be left,top,right,bottom")
+    return (values[0], values[1]), (values[2], values[3])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect keypoints in videos without GUI.")
+    parser.add_argument("videos", nargs="+", help="Video file paths or glob patterns.")
+    parser.add_argument("--engine", default="MediaPipe Holistic", choices=detector_proc.MODEL_NAMES)
+    parser.add_argument(
+        "--mp-components",
+        default="full",
+        choices=["full", "pose_hands", "pose"],
+        help="MediaPipe only: landmarks to output. pose uses the Pose solution, the others Holistic.",
+    )
+    parser.add_argument("--mp-complexity", type=int, default=2, choices=[0, 1, 2], help="MediaPipe only: model complexity.")
+    parser.add_argument("--roi", type=parse_roi, default=None, help="Region of interest in pixels: left,top,right,bottom")
+    parser.add_argument("--auto-roi", action="store_true", help="Set the ROI automatically around the people found in sampled frames.")
+    parser.add_argument("--suffix", action="store_true", help="Add a suffix indicating the engine to the track file name.")
+    parser.add_argument("--batch-size", type=int, default=1, help="Frames per inference call (YOLO only).")
+    parser.add_argument("--stride", type=int, default=1, help="Run inference on every Nth frame only.")
+    parser.add_argument("--no-interpolate", action="store_true", help="Do not fill the skipped frames by linear interpolation.")
+    parser.add_argument(
+        "--motion-threshold",
+        type=float,
+        default=0,
+        help="Skip inference on frames whose mean gray-level difference from the last inferred frame is at most this value (0: disabled).",
+    )
+    parser.add_argument(
+        "--bbox-interval",
+        type=int,
+        default=1,
+        help="RTMPose only: run the person detector every N frames and reuse boxes from the keypoints in between.",
+    )
+    parser.add_argument(
+        "--infer-size",
+        type=int,
+        default=None,
+        help="Downscale frames so that the longer side is at most this many pixels before inference (keypoints are mapped back).",
+    )
+    parser.add_argument("--shards", type=int, default=1, help="Split each video into N time ranges and detect them in parallel processes.")
+    parser.add_argument("--shard-overlap", type=int, default=30, help="Frames detected twice at each split to match members across it.")
+    parser.add_argument(
+        "--store-chunk",
+        type=int,
+        default=0,
+        help="Append results to trk/<name>.partial.h5 every N frames and free them from memory (0: keep everything in memory).",
+    )
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint (.ckpt) left by an interrupted run.")
+    parser.add_argument("--checkpoint-interval", type=int, default=0, help="Write a checkpoint every N frames (0: disabled).")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout
+    video_paths = expand_paths(args.videos)
+    emit(out, "start", engine=args.engine, file_num=len(video_paths))
+
+    failed_num = 0
+    # RoiCapを作っては捨てるとsegfaultの原因になるため、1つを全ての動画で開き直して使う
+    rcap = vcap.RoiCap()
+    for file_idx, video_path in enumerate(video_paths):
+        emit(out, "file_start", file=video_path, file_idx=file_idx, file_num=len(video_paths))
+        progress = ProgressPrinter(out, video_path, file_idx, len(video_paths))
+        try:
+            # detector_proc内のprint()でJSON linesが崩れないようにstderrへ逃がす
+            with contextlib.redirect_stdout(sys.stderr):
+                trk_path = detector_proc.exec(
+                    rcap,
+                    args.engine,
+                    video_path,
+                    add_suffix=args.suffix,
+                    batch_size=args.batch_size,
+                    show=False,
+                    roi_rect=args.roi,
+                    progress=progress,
+                    resume=args.resume,
+                    checkpoint_interval=args.checkpoint_interval,
+                    stride=args.stride,
+                    interpolate=not args.no_interpolate,
+                    motion_threshold=args.motion_threshold,
+                    bbox_interval=args.bbox_interval,
+                    shards=args.shards,
+                    shard_overlap=args.shard_overlap,
+                    use_cache=True,
+                    infer_size=args.infer_size,
+                    auto_roi=args.auto_roi,
+                    store_chunk_frames=args.store_chunk,
+                    mp_components=args.mp_components,
+                    mp_complexity=args.mp_complexity,
+                )
+        except Exception as e:
+            failed_num += 1
+            emit(out, "file_error", file=video_path, file_idx=file_idx, error=f"{type(e).__name__}: {e}")
+            continue
+        emit(out, "file_done", file=video_path, file_idx=file_idx, trk_path=trk_path, elapsed_sec=round(time.perf_counter() - progress.start_time, 1))
+
+    detector_proc.clear_model_cache()
+    emit(out, "done", file_num=len(video_paths), failed_num=failed_num)
+    return 1 if failed_num > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
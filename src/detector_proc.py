@@ -1,8 +1,14 @@
+import datetime
 import importlib.util
+import multiprocessing
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from behavior_senpai import file_inout, mediapipe_detector
+import cv2
+import pandas as pd
+
+from behavior_senpai import detect_checkpoint, file_inout, keypoints_proc, mediapipe_detector, track_store, vcap
 
 
 def is_module_available(module_name):
@@ -25,46 +31,242 @@ else:
     MMPOSE_AVAILABLE = False
 
 
+# {model_name: (factory, suffix)}、factory(model_name, **options)で検出器(DetectorBase)を作る
+# suffixはadd_suffix=Trueのときにtrack fileの名前に付ける
+_detectors = {}
+
+
+def register_detector(model_name, factory, suffix):
+    _detectors[model_name] = (factory, suffix)
+
+
+def _create_yolo(model_name, show=True, batch_size=1, **options):
+    return yolo_detector.YoloDetector(show=show, model=model_name, batch_size=batch_size)
+
+
+def _create_mediapipe(model_name, show=True, mp_components="full", mp_complexity=2, **options):
+    return mediapipe_detector.MediaPipeDetector(show=show, components=mp_components, model_complexity=mp_complexity)
+
+
+def _create_rtmpose(model_name, show=True, bbox_interval=1, **options):
+    whole_body = model_name == "RTMPose-x WholeBody133"
+    return rtmpose_detector.RTMPoseDetector(whole_body=whole_body, show=show, bbox_interval=bbox_interval)
+
+
+if YOLOV8_AVAILABLE is True:
+    register_detector("YOLO11 x-pose", _create_yolo, "yolo11")
+    register_detector("YOLOv8 x-pose-p6", _create_yolo, "yolov8_p6")
+register_detector("MediaPipe Holistic", _create_mediapipe, "mp_holistic")
+if MMPOSE_AVAILABLE is True:
+    register_detector("RTMPose-x Halpe26", _create_rtmpose, "rtm_halpe26")
+    register_detector("RTMPose-x WholeBody133", _create_rtmpose, "rtm_coco133")
+MODEL_NAMES = list(_detectors.keys())
+
+
 def check_gpu():
     return YOLOV8_AVAILABLE, MMPOSE_AVAILABLE
 
 
-def exec(rcap, model_name, video_path, use_roi=False, add_suffix=False):
+# 初期化済みのモデルを動画をまたいで使い回すためのcache、{model_name: model}
+_model_cache = {}
+
+
+def get_model(model_name, show=True, batch_size=1, bbox_interval=1, mp_components="full", mp_complexity=2):
+    """
+    cacheにあるモデルは前の動画の状態をreset()してから設定を変えて返す、なければ初期化してcacheに入れる
+    RTMPoseのように初期化に時間がかかるモデルの読み込みを、batch処理で1回にするために使う
+    MediaPipeは同じインスタンスで連続実行するとNULLポインタ参照で落ちるので、cacheせずに毎回作る
+    """
+    if model_name == "MediaPipe Holistic" or model_name not in _model_cache:
+        model = create_model(
+            model_name,
+            show=show,
+            batch_size=batch_size,
+            bbox_interval=bbox_interval,
+            mp_components=mp_components,
+            mp_complexity=mp_complexity,
+        )
+        if model_name != "MediaPipe Holistic":
+            _model_cache[model_name] = model
+        return model
+    model = _model_cache[model_name]
+    model.reset()
+    model.show = show
+    model.progress = None
+    model.batch_size = max(1, int(batch_size))
+    if hasattr(model, "bbox_interval"):
+        model.bbox_interval = max(1, int(bbox_interval))
+    return model
+
+
+def clear_model_cache():
+    _model_cache.clear()
+
+
+def create_model(model_name, **options):
+    """
+    options: show, batch_size, bbox_interval, mp_components, mp_complexityなど、検出器ごとに使うものだけ使う
+    """
+    if model_name not in _detectors:
+        raise ValueError(f"Unknown or unavailable model: {model_name}")
+    factory, _ = _detectors[model_name]
+    return factory(model_name, **options)
+
+
+def exec(
+    rcap,
+    model_name,
+    video_path,
+    use_roi=False,
+    add_suffix=False,
+    batch_size=1,
+    show=True,
+    roi_rect=None,
+    progress=None,
+    resume=False,
+    checkpoint_interval=0,
+    stride=1,
+    interpolate=True,
+    motion_threshold=0,
+    bbox_interval=1,
+    shards=1,
+    shard_overlap=30,
+    use_cache=False,
+    infer_size=None,
+    auto_roi=False,
+    store_chunk_frames=0,
+    mp_components="full",
+    mp_complexity=2,
+):
+    """
+    batch_size: YOLOで1回の推論にまとめるフレーム数(YOLO以外では無視される)
+    show: Falseにすると検出中の画面表示をしない
+    roi_rect: ((left, top), (right, bottom))を指定するとclick_roi()の代わりにこのROIを使う
+    progress: progress(frame_num, total_frame_num)が1フレームごとに呼ばれる
+    resume: Trueにするとtrkフォルダにあるcheckpoint(.ckpt)の続きから検出する
+    checkpoint_interval: 何フレームごとにcheckpointを書き出すか、0なら書き出さない
+    stride: strideフレームごとに推論する、間のフレームはinterpolate=Trueなら線形補間で埋める
+    motion_threshold: 0より大きいと、動きのないフレームは推論せずに直前のフレームの結果を使う
+    bbox_interval: RTMPoseのみ、人物のbbox検出をこのフレーム数に1回にして、間は前のフレームのkeypointからbboxを作る
+    shards: 2以上にすると動画を時間でshards個に分割し、別々のプロセスで並行に検出してからつなぐ(checkpointは使わない)
+    shard_overlap: 分割したところの前後でmemberを対応付けるために、重ねて検出するフレーム数
+    infer_size: 長辺がこれより大きい動画は、長辺がinfer_sizeになるように縮小して推論する(座標は元の大きさに戻す)
+    auto_roi: Trueにすると数十フレームで人物を検出してそれを囲むROIを自動で決める、roi_rectかuse_roi=Trueのときは使わない
+    store_chunk_frames: 検出結果をこのフレーム数ごとにtrk/xxx.partial.h5へ追記してメモリから捨てる、0ならメモリに溜める
+    mp_components: MediaPipeのみ、"full", "pose_hands", "pose"のどれか(出力するmember)
+    mp_complexity: MediaPipeのみ、model_complexity(0, 1, 2)
+    use_cache: Trueにすると初期化済みのモデルを使い回す(batch処理の最後にclear_model_cache()を呼ぶ)
+    """
+    if model_name not in _detectors:
+        raise ValueError(f"Unknown or unavailable model: {model_name}")
+
     # 動画の読み込み
     rcap.open_file(video_path)
 
-    if use_roi is True:
+    # 指定されたROI、手で囲んだROI、自動のROIの順に優先する
+    if roi_rect is not None:
+        rcap.set_roi(roi_rect[0], roi_rect[1])
+        use_roi = True
+        auto_roi = False
+    elif use_roi is True:
         rcap.click_roi()
+        auto_roi = False
+    elif auto_roi is True:
+        use_roi = True
 
     file_name = os.path.splitext(os.path.basename(video_path))[0]
     trk_dir = os.path.join(os.path.dirname(video_path), "trk")
     os.makedirs(trk_dir, exist_ok=True)
 
-    # モデルの初期化
-    if model_name in ["YOLO11 x-pose", "YOLOv8 x-pose-p6"]:
-        model = yolo_detector.YoloDetector(model=model_name)
-        if model_name == "YOLO11 x-pose":
-            suffix = "yolo11"
-        else:
-            suffix = "yolov8_p6"
-    elif model_name == "MediaPipe Holistic":
-        model = mediapipe_detector.MediaPipeDetector()
-        suffix = "mp_holistic"
-    elif model_name == "RTMPose-x Halpe26":
-        model = rtmpose_detector.RTMPoseDetector()
-        suffix = "rtm_halpe26"
-    elif model_name == "RTMPose-x WholeBody133":
-        model = rtmpose_detector.RTMPoseDetector(whole_body=True)
-        suffix = "rtm_coco133"
+    # モデルの初期化(分割して並列に検出するときはworkerプロセスで初期化する)
+    mp_options = {"mp_components": mp_components, "mp_complexity": mp_complexity}
+    model = None
+    if shards <= 1 and use_cache is True:
+        model = get_model(model_name, show=show, batch_size=batch_size, bbox_interval=bbox_interval, **mp_options)
+    elif shards <= 1:
+        model = create_model(model_name, show=show, batch_size=batch_size, bbox_interval=bbox_interval, **mp_options)
+    _, suffix = _detectors[model_name]
+
+    # ROIの自動設定、分割して検出するときはROIを決めるためだけにモデルを初期化する
+    if auto_roi is True:
+        scan_model = model if model is not None else create_model(model_name, show=False, batch_size=batch_size, **mp_options)
+        use_roi = rcap.auto_roi(scan_model.detect_person_boxes)
+        # 検出に使ったフレームでtrackerなどの状態が変わっているので戻す
+        scan_model.reset()
     if add_suffix is True:
         dst_file_name = f"{file_name}_{suffix}.pkl"
     else:
         dst_file_name = f"{file_name}.pkl"
     pkl_path = os.path.join(trk_dir, dst_file_name)
 
-    model.set_cap(rcap)
-    model.detect(roi=use_roi)
-    result_df = model.get_result()
+    # checkpointのmetaが一致しなければ再開しない
+    meta = {
+        "model": model_name,
+        "video_name": os.path.basename(video_path),
+        "frame_size": (rcap.width, rcap.height),
+        "roi": (rcap.left_top_point, rcap.right_bottom_point) if use_roi is True else None,
+        "stride": stride,
+        "motion_threshold": motion_threshold,
+        "bbox_interval": bbox_interval,
+        "infer_size": infer_size,
+        "mediapipe": mp_options if model_name == "MediaPipe Holistic" else None,
+    }
+    checkpoint = detect_checkpoint.DetectCheckpoint(pkl_path, meta, interval_frames=checkpoint_interval)
+    store = None
+    if shards > 1:
+        roi_rect = (rcap.left_top_point, rcap.right_bottom_point) if use_roi is True else None
+        result_df, frame_timestamps, motion_skipped_num, bbox_report = exec_shards(
+            model_name,
+            video_path,
+            rcap,
+            shards,
+            shard_overlap,
+            roi_rect=roi_rect,
+            batch_size=batch_size,
+            stride=stride,
+            motion_threshold=motion_threshold,
+            bbox_interval=bbox_interval,
+            infer_size=infer_size,
+            **mp_options,
+        )
+    else:
+        start_frame = 0
+        prev_df = None
+        if resume is True:
+            loaded = checkpoint.load()
+            if loaded is not None:
+                last_frame, prev_df = loaded
+                start_frame = last_frame + 1
+                print(f"Resume from frame {start_frame}: {checkpoint.path}")
+        if checkpoint_interval > 0:
+            checkpoint.start(start_frame=start_frame, resumed=prev_df is not None)
+        if store_chunk_frames > 0:
+            store = track_store.TrackStore(pkl_path, chunk_frames=store_chunk_frames)
+            store.start(start_frame=start_frame)
+
+        model.progress = progress
+        model.set_cap(rcap)
+        model.detect(
+            roi=use_roi,
+            start_frame=start_frame,
+            checkpoint=checkpoint if checkpoint_interval > 0 else None,
+            stride=stride,
+            motion_threshold=motion_threshold,
+            infer_size=infer_size,
+            store=store,
+        )
+        result_df = model.get_result()
+        if prev_df is not None:
+            max_distance = max(rcap.width, rcap.height) * 0.05
+            result_df = keypoints_proc.stitch_resumed(prev_df, result_df, max_distance, zero_point=rcap.get_left_top())
+        frame_timestamps = model.frame_timestamps
+        motion_skipped_num = model.motion_skipped_num
+        bbox_report = None
+        if hasattr(model, "bbox_interval") and model.bbox_interval > 1:
+            bbox_report = model.bbox_reuse_report()
+    if stride > 1 and interpolate is True:
+        frame_timestamps = pd.Series(frame_timestamps, dtype=float)
+        result_df = keypoints_proc.interpolate_frames(result_df, stride, frame_timestamps, zero_point=rcap.get_left_top())
 
     # attrsを埋め込み
     result_df.attrs["model"] = model_name
@@ -72,7 +274,200 @@ def exec(rcap, model_name, video_path, use_roi=False, add_suffix=False):
     result_df.attrs["video_name"] = os.path.basename(video_path)
     result_df.attrs["roi_left_top"] = rcap.get_left_top()
     result_df.attrs["created"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    # strideの倍数のframeが推論したframe、それ以外はinterpolatedがTrueなら補間したframe
+    if stride > 1:
+        result_df.attrs["frame_stride"] = stride
+        result_df.attrs["interpolated"] = interpolate
+    if motion_threshold > 0:
+        result_df.attrs["motion_gate"] = {"threshold": motion_threshold, "skipped_frames": motion_skipped_num}
+    if infer_size is not None:
+        result_df.attrs["infer_size"] = infer_size
+    if model_name == "MediaPipe Holistic":
+        result_df.attrs["mediapipe"] = {"components": mp_components, "model_complexity": mp_complexity}
+    if shards > 1:
+        result_df.attrs["shards"] = shards
+    if bbox_report is not None:
+        print(f"BBox reuse: {bbox_report}")
+        result_df.attrs["bbox_reuse"] = bbox_report
 
     file_inout.overwrite_track_file(pkl_path, result_df, not_found_ok=True)
+    checkpoint.remove()
+    if store is not None:
+        store.remove()
     rcap.release()
     return pkl_path
+
+
+def exec_shard(
+    model_name,
+    video_path,
+    start_frame,
+    end_frame,
+    roi_rect=None,
+    batch_size=1,
+    stride=1,
+    motion_threshold=0,
+    bbox_interval=1,
+    infer_size=None,
+    mp_components="full",
+    mp_complexity=2,
+):
+    """
+    exec_shards()のworkerプロセスで実行される
+    start_frameからend_frameの手前までを検出し、
+    (track DataFrame, {frame: timestamp}, 動きがなく推論しなかったフレーム数, bboxを使い回したときのstats)を返す
+    statsはRTMPoseでbbox_intervalが2以上のときだけ、それ以外はNone
+    """
+    rcap = vcap.RoiCap()
+    rcap.open_file(video_path)
+    if roi_rect is not None:
+        rcap.set_roi(roi_rect[0], roi_rect[1])
+    model = create_model(
+        model_name,
+        show=False,
+        batch_size=batch_size,
+        bbox_interval=bbox_interval,
+        mp_components=mp_components,
+        mp_complexity=mp_complexity,
+    )
+    model.set_cap(rcap)
+    model.detect(
+        roi=roi_rect is not None,
+        start_frame=start_frame,
+        end_frame=end_frame,
+        stride=stride,
+        motion_threshold=motion_threshold,
+        infer_size=infer_size,
+    )
+    rcap.release()
+    bbox_stats = model.stats if hasattr(model, "bbox_interval") and model.bbox_interval > 1 else None
+    return model.get_result(), model.frame_timestamps, model.motion_skipped_num, bbox_stats
+
+
+def exec_shards(
+    model_name,
+    video_path,
+    rcap,
+    shards,
+    overlap,
+    roi_rect=None,
+    batch_size=1,
+    stride=1,
+    motion_threshold=0,
+    bbox_interval=1,
+    infer_size=None,
+    mp_components="full",
+    mp_complexity=2,
+):
+    """
+    動画を時間でshards個に分割し、shards個のプロセスで並行に検出してつなぐ
+    2つ目以降のshardは前のshardとoverlapフレームだけ重ねて検出し、そこでmemberを対応付ける
+    (track DataFrame, {frame: timestamp}, 動きがなく推論しなかったフレーム数, bbox使い回しのreportかNone)を返す
+    """
+    total_frame_num = int(rcap.get(cv2.CAP_PROP_FRAME_COUNT))
+    boundaries = [total_frame_num * k // shards for k in range(shards + 1)]
+    ranges = [(max(0, boundaries[k] - overlap) if k > 0 else 0, boundaries[k + 1]) for k in range(shards)]
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=shards, mp_context=ctx) as executor:
+        futures = [
+            executor.submit(
+                exec_shard,
+                model_name,
+                video_path,
+                start,
+                end,
+                roi_rect,
+                batch_size,
+                stride,
+                motion_threshold,
+                bbox_interval,
+                infer_size,
+                mp_components=mp_components,
+                mp_complexity=mp_complexity,
+            )
+            for start, end in ranges
+        ]
+        print(f"{datetime.datetime.now()} Started {shards} shards: {ranges}")
+        # どれか1つでも失敗したら結果をつなげないので例外をそのまま投げる
+        results = [future.result() for future in futures]
+    print(f"{datetime.datetime.now()} All shards done.")
+
+    shard_dfs = [result_df for result_df, *_ in results]
+    frame_timestamps = {}
+    for _, shard_timestamps, *_ in results:
+        frame_timestamps.update(shard_timestamps)
+    motion_skipped_num = sum(skipped_num for _, _, skipped_num, _ in results)
+    # shardごとのbbox使い回しのstatsを足し合わせて、分割しないときと同じreportにする
+    bbox_stats_list = [bbox_stats for *_, bbox_stats in results if bbox_stats is not None]
+    bbox_report = None
+    if len(bbox_stats_list) > 0:
+        bbox_report = rtmpose_detector.bbox_reuse_report(rtmpose_detector.merge_bbox_stats(bbox_stats_list), bbox_interval)
+    # 分割したところで同じ人とみなすkeypointの平均距離は、画面の大きさに対する割合で決める
+    max_distance = max(rcap.width, rcap.height) * 0.05
+    result_df = keypoints_proc.stitch_shards(shard_dfs, boundaries[1:-1], max_distance, zero_point=rcap.get_left_top())
+    return result_df, frame_timestamps, motion_skipped_num, bbox_report
+
+
+def exec_worker(model_name, video_path, add_suffix=False, batch_size=1, auto_roi=False, mp_components="full", mp_complexity=2):
+    """
+    exec_batch()のworkerプロセスで実行される
+    プロセスごとにRoiCapとモデルを持ち、画面表示はしない
+    モデルはworkerプロセスが作り直されるまで(videos_per_worker本)使い回す
+    """
+    rcap = vcap.RoiCap()
+    return exec(
+        rcap,
+        model_name,
+        video_path,
+        use_roi=False,
+        add_suffix=add_suffix,
+        batch_size=batch_size,
+        show=False,
+        use_cache=True,
+        auto_roi=auto_roi,
+        mp_components=mp_components,
+        mp_complexity=mp_complexity,
+    )
+
+
+def exec_batch(
+    model_name,
+    video_paths,
+    workers=2,
+    videos_per_worker=1,
+    add_suffix=False,
+    batch_size=1,
+    auto_roi=False,
+    mp_components="full",
+    mp_complexity=2,
+    progress=None,
+):
+    """
+    複数の動画をworkers個のプロセスで並行に処理する
+    workerプロセスはvideos_per_worker本の動画を処理したら作り直す
+    (mediapipeを同じプロセスで連続実行するとNULLポインタ参照で落ちることへの回避策)
+    progress: progress(done_num, total_num, video_path, pkl_path)が動画が1本終わるごとに呼ばれる、失敗したらpkl_pathはNone
+    戻り値は{video_path: pkl_path}、失敗した動画のpkl_pathはNone
+    """
+    total_num = len(video_paths)
+    results = {}
+    # max_tasks_per_childはforkでは使えないのでspawnにする
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, max_tasks_per_child=videos_per_worker) as executor:
+        futures = {}
+        for video_path in video_paths:
+            future = executor.submit(exec_worker, model_name, video_path, add_suffix, batch_size, auto_roi, mp_components, mp_complexity)
+            futures[future] = video_path
+        print(f"{datetime.datetime.now()} Started {total_num} videos with {workers} workers.")
+
+        for done_num, future in enumerate(as_completed(futures), start=1):
+            video_path = futures[future]
+            try:
+                results[video_path] = future.result()
+                print(f"{datetime.datetime.now()} [{done_num}/{total_num}] Done: {video_path}")
+            except Exception as e:
+                results[video_path] = None
+                print(f"{datetime.datetime.now()} [{done_num}/{total_num}] Failed: {video_path} ({type(e).__name__}: {e})")
+            if progress is not None:
+                progress(done_num, total_num, video_path, results[video_path])
+    return results
@@ -7,7 +7,7 @@ import pandas as pd
 from matplotlib import gridspec, ticker
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 
-from behavior_senpai import img_draw, mediapipe_drawer, pose_drawer, time_format
+from behavior_senpai import frame_time, img_draw, mediapipe_drawer, pose_drawer, time_format
 
 
 class DimensionalReductionPlotter:
@@ -29,6 +29,7 @@ class DimensionalReductionPlotter:
         self.picker_range = None
         self.plot_df = None
         self.timestamps = np.array([])
+        self.frame_time = None
 
     def pack(self, master):
         self.canvas = FigureCanvasTkAgg(self.fig, master=master)
@@ -77,6 +78,8 @@ class DimensionalReductionPlotter:
             self.plot_df["class"] = 0
         self.plot_df.loc[self.plot_df["umap_t"].isna(), "class"] = np.nan
         self.timestamps = self.plot_df["timestamp"].to_numpy()
+        # グラフ上の位置からplot_dfの行を探すための対応表
+        self.frame_time = frame_time.FrameTimeIndex(self.timestamps)
 
         self.line_ax.cla()
 
@@ -173,7 +176,7 @@ class DimensionalReductionPlotter:
             return
 
         timestamp_msec = float(x)
-        idx = np.fabs(self.timestamps - timestamp_msec).argmin()
+        idx = self.frame_time.nearest_idx(timestamp_msec)
 
         mask = ~np.isnan(self.plot_df.iloc[idx]["umap_t"])
         if mask:
@@ -193,7 +196,7 @@ class DimensionalReductionPlotter:
             return
 
         timestamp_msec = float(x)
-        idx = np.fabs(self.timestamps - timestamp_msec).argmin()
+        idx = self.frame_time.nearest_idx(timestamp_msec)
         timestamp_msec = self.timestamps[idx]
 
         if event.button == 3:
@@ -225,6 +228,8 @@ class DimensionalReductionPlotter:
             if (timestamp_msec, self.member) in self.anno_time_member_indexes:
                 tar_df = self.anno_df.loc[pd.IndexSlice[timestamp_msec, self.member, :], :]
                 kps = tar_df.to_numpy()
+                # proxyから読んだframeは元の動画より小さい
+                kps[:, :2] *= frame.shape[0] / self.vcap.get_frame_size()[1]
                 self.anno.set_img(frame)
                 self.anno.set_pose(kps)
                 self.anno.set_track(self.member)
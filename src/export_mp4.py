@@ -4,7 +4,7 @@ from tkinter import messagebox
 import cv2
 import pandas as pd
 
-from behavior_senpai import mediapipe_drawer, pose_drawer
+from behavior_senpai import frame_time, mediapipe_drawer, pose_drawer
 from gui_parts import TempFile
 
 
@@ -32,7 +32,6 @@ class MakeMp4:
 
         if self.cap.isOpened() is True:
             fps = self.cap.get(cv2.CAP_PROP_FPS)
-            self.cap.set_frame_pos(self.time_min)
         else:
             fps = 29.97
 
@@ -65,12 +64,9 @@ class MakeMp4:
         self.out.open(out_file_path, fourcc, fps, size, params=[cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
 
         out_df = tar_df
-        if self.time_min is None or self.time_max is None:
-            min_frame_num = out_df.index.unique(level="frame").min()
-            max_frame_num = out_df.index.unique(level="frame").max() + 1
-        else:
-            min_frame_num = out_df[out_df["timestamp"] >= self.time_min].index.unique(level="frame").min()
-            max_frame_num = out_df[out_df["timestamp"] <= self.time_max].index.unique(level="frame").max() + 1
+        min_frame_num, max_frame_num = self._frame_range(out_df)
+        if self.cap.isOpened() is True:
+            self.cap.set_frame_num(min_frame_num)
 
         out_indexes = out_df.sort_index().index
         frames = out_indexes.get_level_values("frame").unique()
@@ -103,7 +99,6 @@ class MakeMp4:
 
         if self.cap.isOpened() is True:
             fps = self.cap.get(cv2.CAP_PROP_FPS)
-            self.cap.set_frame_pos(self.time_min)
         else:
             fps = 29.97
 
@@ -116,13 +111,9 @@ class MakeMp4:
         self.out.open(out_file_path, fourcc, fps, size, params=[cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
 
         out_df = tar_df
-        if self.time_min is None or self.time_max is None:
-            min_frame_num = out_df.index.unique(level="frame").min()
-            max_frame_num = out_df.index.unique(level="frame").max() + 1
-        else:
-            # between time_min and time_max ["timestamp"]column
-            min_frame_num = out_df[out_df["timestamp"] >= self.time_min].index.unique(level="frame").min()
-            max_frame_num = out_df[out_df["timestamp"] <= self.time_max].index.unique(level="frame").max() + 1
+        min_frame_num, max_frame_num = self._frame_range(out_df)
+        if self.cap.isOpened() is True:
+            self.cap.set_frame_num(min_frame_num)
 
         for i in range(min_frame_num, max_frame_num):
             frame = self.cap.read_anyway()
@@ -137,6 +128,13 @@ class MakeMp4:
         messagebox.showinfo("Export MP4", f"Export finished.\nfile name: {mp4_name}")
         return mp4_name
 
+    def _frame_range(self, out_df):
+        """Return (first frame, last frame + 1) between time_min and time_max"""
+        frame_time_index = frame_time.from_track(out_df)
+        if self.time_min is None or self.time_max is None:
+            return frame_time_index.frame_range()
+        return frame_time_index.frame_range(self.time_min, self.time_max)
+
     def _draw(self, out_df, frame_num, member, all_indexes, anno, scale):
         if (frame_num, member) not in all_indexes.droplevel(2):
             return anno.dst_img
@@ -187,6 +187,8 @@ class App(ttk.Frame):
         keypoints_btn.pack(padx=(10, 0), pady=(5, 0), expand=True, fill=tk.X)
 
         self.vcap = vcap.VideoCap()
+        # 分割された動画用、VideoCapを作っては捨てるとsegfaultの原因になるため1つを使い回す
+        self.multi_cap = None
         self.cap = self.vcap
         self.pkl_path = ""
         self.pkl_dir = None
@@ -230,8 +232,11 @@ class App(ttk.Frame):
         self.vcap.set_frame_size(src_attrs.attrs["frame_size"])
         if isinstance(src_attrs.attrs["video_name"], list):
             video_list = [os.path.abspath(os.path.join(self.pkl_dir, os.pardir, video)) for video in src_attrs.attrs["video_name"]]
-            self.cap = vcap.MultiVcap(self.vcap)
-            self.cap.open_files(video_list)
+            if self.multi_cap is None:
+                self.multi_cap = vcap.MultiVcap(self.vcap)
+            self.multi_cap.open_files(video_list)
+            self.multi_cap.set_frame_size(src_attrs.attrs["frame_size"])
+            self.cap = self.multi_cap
         else:
             self.vcap.open_file(os.path.join(self.pkl_dir, os.pardir, src_attrs.attrs["video_name"]))
             self.cap = self.vcap
@@ -3,14 +3,13 @@ import time
 import cv2
 import matplotlib
 import matplotlib.pyplot as plt
-import numpy as np
 import pandas as pd
 import PIL
 import seaborn as sns
 from matplotlib import gridspec, ticker
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 
-from behavior_senpai import mediapipe_drawer, pose_drawer, time_format
+from behavior_senpai import frame_time, mediapipe_drawer, pose_drawer, time_format
 
 plt.rc("svg", fonttype="none")
 plt.rc("savefig", format="svg", transparent=True)
@@ -74,7 +73,7 @@ class LinePlotter:
             cols_for_anno = ["x", "y", "likelihood"]
         self.anno_df = trk_df.reset_index().set_index(["timestamp", "member", "keypoint"]).loc[:, cols_for_anno]
         self.anno_time_member_indexes = self.anno_df.index.droplevel(2).unique()
-        self.timestamps = self.anno_time_member_indexes.get_level_values("timestamp").unique().to_numpy()
+        self.frame_time = frame_time.FrameTimeIndex(self.anno_time_member_indexes.get_level_values("timestamp").unique())
         print(f"set_trk_df() (line_plotter.LinePlotter): {time.perf_counter() - start_time:.3f}sec")
 
     def set_plot(self, plot_df, member: str, data_col_names: list):
@@ -138,7 +137,7 @@ class LinePlotter:
         self.line_ax.grid(which="major", axis="x", linewidth=0.3)
 
         show_df = plot_df.reset_index().set_index(["timestamp", "member"]).loc[:, :]
-        self.timestamps = show_df.index.get_level_values("timestamp").unique().to_numpy()
+        self.frame_time = frame_time.FrameTimeIndex(show_df.index.get_level_values("timestamp").unique())
 
     def set_plot_rect(self, rects: list, time_min_msec: int, time_max_msec: int):
         # カラムごとにdtypeを指定してDataFrameを作成
@@ -219,7 +218,7 @@ class LinePlotter:
             timestamp_msec = float(x)
 
         elif event.button == 3:
-            timestamp_msec = self.vcap.get(cv2.CAP_PROP_POS_MSEC)
+            timestamp_msec = self.vcap.get_read_msec()
             timestamp_msec += 100
 
         self.vline.set_xdata([timestamp_msec])
@@ -232,13 +231,14 @@ class LinePlotter:
         if ret is False:
             return
 
-        idx = np.fabs(self.timestamps - timestamp_msec).argmin()
-        timestamp_msec = self.timestamps[idx]
+        timestamp_msec = self.frame_time.nearest_msec(timestamp_msec)
 
         if self.draw_anno is True:
             canvas_height = self.img_canvas.winfo_height()
             resize_ratio = canvas_height / frame.shape[0]
             frame = cv2.resize(frame, None, fx=resize_ratio, fy=resize_ratio)
+            # proxyから読んだframeは元の動画より小さいので、keypointは元の動画の大きさから合わせる
+            kps_ratio = canvas_height / self.vcap.get_frame_size()[1]
 
             if len(self.members) == 0:
                 self.members = [self.member]
@@ -246,7 +246,7 @@ class LinePlotter:
                 if (timestamp_msec, member) in self.anno_time_member_indexes:
                     tar_df = self.anno_df.loc[pd.IndexSlice[timestamp_msec, member, :], :]
                     kps = tar_df.to_numpy()
-                    kps[:, :2] *= resize_ratio
+                    kps[:, :2] *= kps_ratio
                     self.anno.set_img(frame)
                     self.anno.set_pose(kps)
                     self.anno.set_track(member)
@@ -6,7 +6,7 @@ import numpy as np
 import pandas as pd
 from PIL import Image, ImageTk
 
-from behavior_senpai import file_inout, img_draw, mediapipe_drawer, pose_drawer, time_format
+from behavior_senpai import file_inout, frame_time, img_draw, mediapipe_drawer, pose_drawer, time_format, vcap
 from gui_parts import TempFile
 
 
@@ -157,6 +157,14 @@ class CapCanvas(tk.Canvas):
         self.anno_df = None
         self.current_msec = 0
         self.is_crop = True
+        # 先読み、まだ読めていない位置を表示しようとしたらpending_msecに入れて読み終わるのを待つ
+        # 先読み用のVideoCapは作っては捨てないように、1つを使い回して開き直す
+        self.prefetcher = None
+        self.use_prefetch = False
+        self.pending_msec = None
+        self.poll_id = None
+        self.prefetch_ahead_num = 30
+        self.prefetch_behind_num = 10
 
         # set click event
         self.bind("<Button-1>", self._on_click)
@@ -164,6 +172,12 @@ class CapCanvas(tk.Canvas):
     def set_cap(self, cap, frame_size):
         self.cap = cap
         self.frame_size = frame_size
+        self.pending_msec = None
+        self.use_prefetch = cap.isOpened()
+        if self.use_prefetch is True:
+            if self.prefetcher is None:
+                self.prefetcher = vcap.FramePrefetcher()
+            self.prefetcher.open(cap)
 
     def set_trk(self, src_df):
         if src_df.attrs["model"] in ["YOLOv8 x-pose-p6", "YOLO11 x-pose"]:
@@ -184,7 +198,8 @@ class CapCanvas(tk.Canvas):
             cols_for_anno = ["x", "y", "likelihood"]
         self.anno_df = src_df.reset_index().set_index(["timestamp", "member", "keypoint"]).loc[:, cols_for_anno]
         self.org_anno_df = self.anno_df.copy()
-        self.timestamps = self.anno_df.index.get_level_values("timestamp").unique().to_numpy()
+        # frameごとのtimestampの対応表、update()のたびに全timestampを走査しないように一度だけ作る
+        self.frame_time = frame_time.from_track(src_df)
 
     def set_area(self):
         if self.is_crop is False:
@@ -223,10 +238,60 @@ class CapCanvas(tk.Canvas):
         self.anno_df.loc[:, ["x", "y"]] = self.org_anno_df.loc[:, ["x", "y"]] * self.scale
 
     def update(self, msec):
-        msec = self.timestamps[np.fabs(self.timestamps - msec).argsort()[:1]][0]
-        ok, image_rgb = self.cap.read_at(msec, scale=self.scale, rgb=True)
-        if ok is False:
+        msec = self.frame_time.nearest_msec(msec)
+        if self.use_prefetch is False:
+            ok, image_rgb = self.cap.read_at(msec, scale=self.scale, rgb=True)
+            if ok is False:
+                return
+            self._draw(msec, image_rgb)
             return
+
+        # 先読みしてあれば表示し、なければ読み終わったときに表示する
+        self._prefetch_around(msec)
+        self.current_msec = msec
+        image_rgb = self.prefetcher.get(msec, self.scale)
+        if image_rgb is None:
+            self.pending_msec = msec
+            if self.poll_id is None:
+                self.poll_id = self.after(10, self._poll)
+            return
+        self.pending_msec = None
+        self._draw(msec, image_rgb)
+
+    def _prefetch_around(self, msec):
+        """
+        進んでいる向きを多めに、msecの前後のtimestampを先読みさせる
+        """
+        timestamps = self.frame_time.timestamps
+        idx = int(np.searchsorted(timestamps, msec))
+        after = timestamps[idx + 1 :]
+        before = timestamps[:idx][::-1]
+        if msec < self.current_msec:
+            ahead, behind = before, after
+        else:
+            ahead, behind = after, before
+        self.prefetcher.request([msec, *ahead[: self.prefetch_ahead_num], *behind[: self.prefetch_behind_num]], self.scale)
+
+    def _poll(self):
+        """
+        Tkのafter()で呼ばれる、待っている位置が読み終わっていれば表示する
+        スライダーが先に動いていれば、古い位置ではなく最後に指定された位置を待つ
+        """
+        self.poll_id = None
+        if self.pending_msec is None:
+            return
+        msec = self.pending_msec
+        image_rgb = self.prefetcher.get(msec, self.scale)
+        if image_rgb is None:
+            if self.prefetcher.is_failed(msec, self.scale) is True:
+                self.pending_msec = None
+                return
+            self.poll_id = self.after(10, self._poll)
+            return
+        self.pending_msec = None
+        self._draw(msec, image_rgb)
+
+    def _draw(self, msec, image_rgb):
         if self.anno_df is not None:
             tar_df = self.anno_df.loc[pd.IndexSlice[msec, :, :], :]
             members = tar_df.index.get_level_values("member").unique().tolist()
@@ -0,0 +1,38 @@
+"""
+Make low-resolution proxy videos for browsing in the GUI.
+Each proxy is written to a "proxy" folder next to the video (proxy/<name>.avi, MJPG).
+The viewers read frames from the proxy when it exists; detection and mp4 export always use the original video.
+
+Run from the repository root (the same directory as launcher), e.g.
+    python src/proxy_cli.py "D:/videos/*.mp4" --long-side 960
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+from behavior_senpai import video_proxy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Make low-resolution proxy videos for the GUI.")
+    parser.add_argument("videos", nargs="+", help="Video file paths or glob patterns.")
+    parser.add_argument("--long-side", type=int, default=960, help="Longer side of the proxy in pixels.")
+    args = parser.parse_args(argv)
+
+    video_paths = []
+    for pattern in args.videos:
+        matched = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        video_paths += [path for path in matched if os.path.isfile(path) and path not in video_paths]
+
+    failed_num = 0
+    for video_path in video_paths:
+        print(video_path)
+        if video_proxy.make_proxy(video_path, long_side=args.long_side) is None:
+            failed_num += 1
+    return 1 if failed_num > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
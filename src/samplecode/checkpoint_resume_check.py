@@ -0,0 +1,49 @@
+import os
+import pickle
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from behavior_senpai import detect_checkpoint, track_buffer
+
+# 追記の途中で落ちたcheckpointから再開して、もう一度落ちても再開後の進み具合が残ることを確かめる
+META = {"model": "check", "video_name": "check.mp4"}
+INTERVAL_FRAMES = 10
+
+
+def run_frames(checkpoint, buffer, start_frame, end_frame):
+    for i in range(start_frame, end_frame):
+        buffer.begin_frame()
+        buffer.append(i, [1], np.full((1, 2, 3), i, dtype=np.float64), i * 33.3)
+        checkpoint.update(i, buffer)
+
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    pkl_path = os.path.join(tmp_dir, "check.pkl")
+
+    # 1回目: frame 0-24まで進んで、次のレコードを書いている途中で落ちる
+    checkpoint = detect_checkpoint.DetectCheckpoint(pkl_path, META, interval_frames=INTERVAL_FRAMES)
+    checkpoint.start()
+    buffer = track_buffer.TrackBuffer(["x", "y", "z"])
+    run_frames(checkpoint, buffer, 0, 25)
+    half_record = pickle.dumps({"last_frame": 29, "rows": buffer.to_dataframe()})
+    with open(checkpoint.path, "ab") as f:
+        f.write(half_record[: len(half_record) // 2])
+
+    # 2回目: 再開してframe 40まで進んで、また落ちる
+    checkpoint = detect_checkpoint.DetectCheckpoint(pkl_path, META, interval_frames=INTERVAL_FRAMES)
+    last_frame, prev_df = checkpoint.load()
+    assert last_frame == 19, last_frame
+    checkpoint.start(start_frame=last_frame + 1, resumed=True)
+    buffer = track_buffer.TrackBuffer(["x", "y", "z"])
+    run_frames(checkpoint, buffer, last_frame + 1, 41)
+
+    # 3回目: 2回目に書いたレコードまで読めること
+    checkpoint = detect_checkpoint.DetectCheckpoint(pkl_path, META, interval_frames=INTERVAL_FRAMES)
+    last_frame, loaded_df = checkpoint.load()
+    assert last_frame == 39, last_frame
+    frames = loaded_df.index.get_level_values("frame")
+    assert np.array_equal(np.unique(frames), np.arange(40)), np.unique(frames)
+    print(f"OK: resumed up to frame {last_frame}, {len(loaded_df)} rows")
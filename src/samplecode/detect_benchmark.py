@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from behavior_senpai import synthetic_detector, vcap
+
+# モデルの重みもGPUもない環境で、読み込みから結果の詰め込みまでのスループットを測る
+# SyntheticDetectorのsec_per_frameで推論の待ち時間を真似て、バッチサイズごとのframe/secを比べる
+FRAME_NUM = 300
+FRAME_SIZE = (1280, 720)
+SEC_PER_FRAME = 0.005
+
+
+def make_video(video_path):
+    """
+    動く円を描いたテスト用の動画を作る
+    """
+    rng = np.random.default_rng(0)
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"mp4v"), 30, FRAME_SIZE)
+    for i in range(FRAME_NUM):
+        frame = (rng.random((FRAME_SIZE[1], FRAME_SIZE[0], 3)) * 64).astype(np.uint8)
+        cv2.circle(frame, (i * 4 % FRAME_SIZE[0], FRAME_SIZE[1] // 2), 40, (0, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+
+def measure(cap, video_path, batch_size, **kwargs):
+    """
+    capで開き直して測る、RoiCapを作っては捨てるとsegfaultの原因になるため1つを使い回す
+    """
+    cap.open_file(video_path)
+    detector = synthetic_detector.SyntheticDetector(show=False, batch_size=batch_size, sec_per_frame=SEC_PER_FRAME)
+    detector.set_cap(cap)
+    start_time = time.perf_counter()
+    detector.detect(**kwargs)
+    elapsed_sec = time.perf_counter() - start_time
+    return detector.get_result(), FRAME_NUM / elapsed_sec
+
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    video_path = os.path.join(tmp_dir, "synthetic.mp4")
+    make_video(video_path)
+    print(f"frames={FRAME_NUM}, size={FRAME_SIZE}, sec_per_frame={SEC_PER_FRAME}")
+    print("batch_size, infer_size, frame/sec")
+    base_df = None
+    cap = vcap.RoiCap()
+    for batch_size in [1, 4, 8]:
+        for infer_size in [None, 640]:
+            dst_df, fps = measure(cap, video_path, batch_size, infer_size=infer_size)
+            # 同じ条件なら結果はバッチサイズによらず同じになる
+            if infer_size is None:
+                if base_df is None:
+                    base_df = dst_df
+                assert dst_df.equals(base_df)
+            print(f"{batch_size}, {infer_size}, {fps:.1f}")
+    cap.release()
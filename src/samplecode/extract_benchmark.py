@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from behavior_senpai import track_buffer
+
+# 検出結果の取り出し(後処理)にかかる1フレームあたりの時間を、要素ごとに取り出す方法とまとめて取り出す方法で比べる
+# torchがあれば推論結果と同じようにtensor(CUDAが使えればGPU上)から取り出す
+FRAME_NUM = 300
+MEMBER_NUM = 4
+LEFT_TOP_POINT = (320, 180)
+
+try:
+    import torch
+
+    DEVICE = "cuda:0" if torch.cuda.is_available() else "cpu"
+except ImportError:
+    torch = None
+    DEVICE = "numpy"
+
+
+def make_results(keypoint_num):
+    rng = np.random.default_rng(0)
+    results = []
+    for _ in range(FRAME_NUM):
+        keypoints = rng.random((MEMBER_NUM, keypoint_num, 3), dtype=np.float32) * 1000
+        boxes = np.zeros((MEMBER_NUM, 7), dtype=np.float32)
+        boxes[:, 4] = np.arange(MEMBER_NUM)
+        if torch is not None:
+            keypoints = torch.from_numpy(keypoints).to(DEVICE)
+            boxes = torch.from_numpy(boxes).to(DEVICE)
+        results.append((keypoints, boxes))
+    return results
+
+
+def extract_per_element(results, keypoint_num):
+    """
+    以前の取り出し方、keypointの要素ごとにfloat()してリストに詰める
+    """
+    data_dict = {"frame": [], "member": [], "keypoint": [], "x": [], "y": [], "conf": [], "timestamp": []}
+    for i, (result_keypoints, result_boxes) in enumerate(results):
+        for keypoints, boxes in zip(result_keypoints, result_boxes, strict=False):
+            member_id = int(boxes[4])
+            for k in range(keypoint_num):
+                x = float(keypoints[k][0]) + LEFT_TOP_POINT[0]
+                y = float(keypoints[k][1]) + LEFT_TOP_POINT[1]
+                conf = float(keypoints[k][2])
+                data_dict["frame"].append(i)
+                data_dict["member"].append(member_id)
+                data_dict["keypoint"].append(k)
+                data_dict["x"].append(x)
+                data_dict["y"].append(y)
+                data_dict["conf"].append(conf)
+                data_dict["timestamp"].append(i * 33.3)
+    return pd.DataFrame(data_dict).set_index(["frame", "member", "keypoint"])
+
+
+def extract_block(results):
+    """
+    いまの取り出し方、1フレーム分をまとめてhostに移し、配列の演算でROIのoffsetを足してTrackBufferに詰める
+    """
+    buffer = track_buffer.TrackBuffer(["x", "y", "conf"])
+    for i, (result_keypoints, result_boxes) in enumerate(results):
+        if torch is not None:
+            keypoints = result_keypoints.cpu().numpy()
+            member_ids = result_boxes[:, 4].cpu().numpy().astype(int)
+        else:
+            keypoints = result_keypoints.copy()
+            member_ids = result_boxes[:, 4].astype(int)
+        keypoints[:, :, 0] += LEFT_TOP_POINT[0]
+        keypoints[:, :, 1] += LEFT_TOP_POINT[1]
+        buffer.begin_frame()
+        buffer.append(i, member_ids, keypoints, i * 33.3)
+    return buffer.to_dataframe()
+
+
+def measure(func, *args):
+    start_time = time.perf_counter()
+    dst_df = func(*args)
+    elapsed_msec = (time.perf_counter() - start_time) * 1000
+    return dst_df, elapsed_msec / FRAME_NUM
+
+
+print(f"device={DEVICE}, frames={FRAME_NUM}, members={MEMBER_NUM}")
+print("keypoints, per element [ms/frame], block [ms/frame], speedup")
+for keypoint_num in [17, 26, 133]:
+    results = make_results(keypoint_num)
+    before_df, before_msec = measure(extract_per_element, results, keypoint_num)
+    after_df, after_msec = measure(extract_block, results)
+    # 取り出した値が同じであることも確認する(float32からの変換の誤差は許す)
+    assert np.allclose(before_df.to_numpy(), after_df.to_numpy(), atol=1e-3)
+    print(f"{keypoint_num}, {before_msec:.3f}, {after_msec:.3f}, {before_msec / after_msec:.1f}x")
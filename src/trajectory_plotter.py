@@ -91,7 +91,9 @@ class TrajectoryPlotter:
         else:
             print(plot_len)
         (self.traj_point,) = self.traj_ax.plot([], [], color="#02326f", marker=".")
-        self.traj_img = self.traj_ax.imshow(np.full((height, width, 3), 255, dtype=np.uint8), aspect="auto")
+        # proxyから読んだ小さなframeでも元の動画の座標に合わせて表示するようにextentを固定する
+        extent = (-0.5, width - 0.5, height - 0.5, -0.5)
+        self.traj_img = self.traj_ax.imshow(np.full((height, width, 3), 255, dtype=np.uint8), aspect="auto", extent=extent)
         self.traj_img.autoscale()
         self.traj_ax.xaxis.set_visible(False)
         self.traj_ax.yaxis.set_visible(False)